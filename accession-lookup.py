@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import logging
+import sys
+
+import ipu.lookup
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s: %(levelname)s: %(message)s',
+    datefmt='%y-%m-%d %H:%M:%S'
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query a UniProt accession index')
+    subparsers = parser.add_subparsers(dest='command')
+
+    parser_build = subparsers.add_parser('build', help='build an index from an HDF5 file')
+    parser_build.add_argument('h5', metavar='uniprot.h5', help='HDF5 file created by the load/merge steps')
+    parser_build.add_argument('index', help='output directory')
+
+    parser_query = subparsers.add_parser('query', help='look up accessions')
+    parser_query.add_argument('index', help='index directory')
+    parser_query.add_argument('accessions', nargs='*', help='protein accessions')
+    parser_query.add_argument('-f', '--file', help='file of accessions, one per line (- for stdin)')
+    parser_query.add_argument('-s', '--secondary', action='store_true', default=False,
+                              help='look up secondary accessions and report their primary accessions')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        ipu.lookup.build_index(args.h5, args.index)
+    elif args.command == 'query':
+        accessions = list(args.accessions)
+        if args.file == '-':
+            accessions += [line.strip() for line in sys.stdin if line.strip()]
+        elif args.file:
+            with open(args.file, 'rt') as fh:
+                accessions += [line.strip() for line in fh if line.strip()]
+
+        index = ipu.lookup.AccessionIndex(args.index)
+
+        if args.secondary:
+            for ac, primaries in zip(accessions, index.primary_many(accessions)):
+                print('{}\t{}'.format(ac, ','.join(primaries) if primaries else '-'))
+        else:
+            columns = [col for col in index.columns if col != 'ac']
+            print('\t'.join(['ac'] + columns))
+            for ac, obj in zip(accessions, index.get_many(accessions)):
+                if obj is None:
+                    print('{}\t{}'.format(ac, '\t'.join('-' for _ in columns)))
+                else:
+                    print('\t'.join([ac] + [str(obj[col]) for col in columns]))
+    else:
+        parser.print_help()
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import datetime
+import io
+import time
+
+import cx_Oracle
+
+import ipu.utils
+
+
+class FakeCursor(object):
+    """Serves generated MATCH-like rows, as a cursor would after ``execute()``.
+
+    :param n: number of rows.
+    :param dates_as_strings: if ``True``, dates are returned as strings (like with ``TO_CHAR`` in ``ipu.utils.dump_table``).
+    """
+
+    description = [
+        ('PROTEIN_AC', cx_Oracle.FIXED_CHAR),
+        ('METHOD_AC', cx_Oracle.STRING),
+        ('POS_FROM', cx_Oracle.NUMBER),
+        ('POS_TO', cx_Oracle.NUMBER),
+        ('STATUS', cx_Oracle.FIXED_CHAR),
+        ('SEQ_DATE', cx_Oracle.DATETIME),
+        ('SCORE', cx_Oracle.NUMBER),
+        ('MODEL_AC', cx_Oracle.STRING),
+    ]
+
+    def __init__(self, n, dates_as_strings=False, arraysize=10000):
+        self.arraysize = arraysize
+        self.i = 0
+
+        if dates_as_strings:
+            self.description = [(name, cx_Oracle.STRING if name == 'SEQ_DATE' else type_code)
+                                for name, type_code in FakeCursor.description]
+
+        date = datetime.datetime(2017, 7, 5, 12, 30)
+        if dates_as_strings:
+            date = date.strftime('%Y-%m-%d %H:%M:%S')
+
+        self.rows = []
+        for i in range(min(n, arraysize)):
+            self.rows.append(('P{:05d}'.format(i), 'PF{:05d}'.format(i), i, i + 100, 'T', date,
+                              None if i % 3 else 1.5e-10, 'PF{:05d}'.format(i)))
+
+        self.n = n
+
+    def __iter__(self):
+        for i in range(self.n):
+            yield self.rows[i % len(self.rows)]
+
+    def fetchmany(self):
+        if self.i >= self.n:
+            return []
+
+        k = min(self.arraysize, self.n - self.i)
+        self.i += k
+        return self.rows[:k]
+
+
+def legacy_write_rows(cursor, fh, buffersize=1000000, separator='|'):
+    # Row-by-row implementation used by dump_table() before columnar export
+    fmt = separator.join(['{}' for _ in range(len(cursor.description))]) + '\n'
+    data = []
+    cnt = 0
+    for row in cursor:
+        cnt += 1
+        _row = []
+        for col in row:
+            if isinstance(col, datetime.datetime):
+                _row.append(col.strftime('%Y-%m-%d %H:%M:%S'))
+            elif col is None:
+                _row.append('NULL')
+            else:
+                _row.append(col)
+        data.append(_row)
+
+        if not cnt % buffersize:
+            fh.write(''.join([fmt.format(*row) for row in data]))
+            data = []
+
+    if data:
+        fh.write(''.join([fmt.format(*row) for row in data]))
+
+    return cnt
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the formatting of rows dumped by ipu.utils.dump_table()')
+    parser.add_argument('-n', type=int, default=1000000, help='number of rows (default: 1000000)')
+    args = parser.parse_args()
+
+    t = time.time()
+    legacy_write_rows(FakeCursor(args.n), io.StringIO())
+    legacy = args.n / (time.time() - t)
+
+    t = time.time()
+    ipu.utils.write_rows(FakeCursor(args.n, dates_as_strings=True), io.BytesIO())
+    columnar = args.n / (time.time() - t)
+
+    print('row-by-row: {:>12,.0f} rows/s'.format(legacy))
+    print('columnar:   {:>12,.0f} rows/s ({:.1f}x)'.format(columnar, columnar / legacy))
+
+
+if __name__ == '__main__':
+    main()
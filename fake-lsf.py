@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Minimal stand-in for the LSF commands used by mundone (bsub, bjobs, bkill), to run workflows without a cluster.
+
+Jobs run on the local host. Their state is kept in $FAKE_LSF_DIR (default: <tmpdir>/fake-lsf).
+
+Usage:
+    python fake-lsf.py install DIR
+    PATH=DIR:$PATH python ipucli.py ...
+
+Every call is appended to $FAKE_LSF_DIR/calls.log, e.g. to check how many times bjobs was called.
+"""
+
+import argparse
+import json
+import os
+import signal
+import stat
+import sys
+import tempfile
+from subprocess import Popen, DEVNULL
+
+STATE_DIR = os.environ.get('FAKE_LSF_DIR', os.path.join(tempfile.gettempdir(), 'fake-lsf'))
+
+
+def _job_file(job_id):
+    return os.path.join(STATE_DIR, '{}.json'.format(job_id))
+
+
+def _exit_file(job_id):
+    return os.path.join(STATE_DIR, '{}.exit'.format(job_id))
+
+
+def _log_call(args):
+    with open(os.path.join(STATE_DIR, 'calls.log'), 'at') as fh:
+        fh.write(' '.join(args) + '\n')
+
+
+def _next_id():
+    ids = [int(f.split('.')[0]) for f in os.listdir(STATE_DIR) if f.endswith('.json')]
+    return max(ids) + 1 if ids else 1
+
+
+def _status(job_id):
+    try:
+        with open(_job_file(job_id), 'rt') as fh:
+            job = json.load(fh)
+    except FileNotFoundError:
+        return None
+
+    try:
+        with open(_exit_file(job_id), 'rt') as fh:
+            returncode = int(fh.read())
+    except (FileNotFoundError, ValueError):
+        pass
+    else:
+        return 'DONE' if returncode == 0 else 'EXIT'
+
+    try:
+        os.kill(job['pid'], 0)
+    except ProcessLookupError:
+        return 'EXIT'  # died without writing its exit status
+    else:
+        return 'RUN'
+
+
+def bsub(argv):
+    parser = argparse.ArgumentParser(prog='bsub')
+    parser.add_argument('-q')
+    parser.add_argument('-J')
+    parser.add_argument('-n')
+    parser.add_argument('-R', action='append')
+    parser.add_argument('-M')
+    parser.add_argument('-o')
+    parser.add_argument('-e')
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    job_id = _next_id()
+    with open(_job_file(job_id), 'wt') as fh:
+        json.dump(dict(pid=None, name=args.J, queue=args.q or 'normal'), fh)
+
+    out = open(args.o, 'wt') if args.o else DEVNULL
+    err = open(args.e, 'wt') if args.e else DEVNULL
+    proc = Popen([sys.executable, os.path.realpath(__file__), 'run', str(job_id)] + args.command,
+                 stdout=out, stderr=err, start_new_session=True)
+
+    with open(_job_file(job_id), 'wt') as fh:
+        json.dump(dict(pid=proc.pid, name=args.J, queue=args.q or 'normal'), fh)
+
+    print('Job <{}> is submitted to queue <{}>.'.format(job_id, args.q or 'normal'))
+
+
+def run(argv):
+    job_id = argv[0]
+    returncode = Popen(argv[1:]).wait()
+
+    with open(_exit_file(job_id), 'wt') as fh:
+        fh.write(str(returncode))
+
+
+def bjobs(argv):
+    parser = argparse.ArgumentParser(prog='bjobs')
+    parser.add_argument('-o')
+    parser.add_argument('-noheader', action='store_true')
+    parser.add_argument('job_ids', nargs='*', type=int)
+    args = parser.parse_args(argv)
+
+    if not args.o and not args.noheader:
+        print('JOBID   USER    STAT  QUEUE      FROM_HOST   EXEC_HOST   JOB_NAME   SUBMIT_TIME')
+
+    for job_id in args.job_ids:
+        status = _status(job_id)
+        if status is None:
+            sys.stderr.write('Job <{}> is not found\n'.format(job_id))
+        elif args.o:
+            print('{} {}'.format(job_id, status))
+        else:
+            print('{:<7} {:<7} {:<5} normal     localhost   localhost   -          -'.format(
+                job_id, os.environ.get('USER', '-'), status)
+            )
+
+
+def bkill(argv):
+    for job_id in map(int, argv):
+        try:
+            with open(_job_file(job_id), 'rt') as fh:
+                job = json.load(fh)
+        except FileNotFoundError:
+            sys.stderr.write('Job <{}>: No matching job found\n'.format(job_id))
+            continue
+
+        try:
+            os.killpg(job['pid'], signal.SIGKILL)
+        except ProcessLookupError:
+            sys.stderr.write('Job <{}>: Job has already finished\n'.format(job_id))
+        else:
+            with open(_exit_file(job_id), 'wt') as fh:
+                fh.write('130')
+
+            print('Job <{}> is being terminated'.format(job_id))
+
+
+def install(dirname):
+    try:
+        os.makedirs(dirname)
+    except FileExistsError:
+        pass
+
+    for command in ('bsub', 'bjobs', 'bkill'):
+        pathname = os.path.join(dirname, command)
+        with open(pathname, 'wt') as fh:
+            fh.write('#!/bin/sh\nexec "{}" "{}" {} "$@"\n'.format(sys.executable, os.path.realpath(__file__), command))
+
+        os.chmod(pathname, os.stat(pathname).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.stderr.write(__doc__)
+        exit(1)
+
+    command, argv = sys.argv[1], sys.argv[2:]
+
+    if command == 'install' and argv:
+        install(argv[0])
+        return
+
+    try:
+        os.makedirs(STATE_DIR)
+    except FileExistsError:
+        pass
+
+    if command != 'run':
+        _log_call([command] + argv)
+
+    if command == 'bsub':
+        bsub(argv)
+    elif command == 'run':
+        run(argv)
+    elif command == 'bjobs':
+        bjobs(argv)
+    elif command == 'bkill':
+        bkill(argv)
+    else:
+        sys.stderr.write(__doc__)
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,6 @@
 
 import logging
 
-import cx_Oracle
-
 from . import utils, xref
 
 
@@ -84,7 +82,7 @@ def prepare_feature_matches(db_user, db_passwd, db_host, **kwargs):
 
 
 def add_new_feature_matches(user, passwd, db, chunksize=100000):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
         cur2 = con.cursor()
@@ -180,7 +178,7 @@ def update_feature_matches(user, passwd, db):
 
 
 def delete_feature_match(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -197,7 +195,7 @@ def delete_feature_match(user, passwd, db):
 
 
 def insert_feature_match(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -209,7 +207,7 @@ def insert_feature_match(user, passwd, db):
 
 
 def pre_prod(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -352,7 +350,7 @@ def pre_prod(user, passwd, db):
     }
 
 def refresh(db_user, db_passwd, db_host):
-    with cx_Oracle.connect(db_user, db_passwd, db_host) as con:
+    with utils.connect(db_user, db_passwd, db_host) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -4,7 +4,6 @@
 import logging
 import os
 import sys
-import cx_Oracle
 from mundone import Batch, Task
 
 from . import utils
@@ -16,6 +15,12 @@ logging.basicConfig(
     datefmt='%y-%m-%d %H:%M:%S'
 )
 
+# Partitions of IPRSCAN.SITE: (materialized view, Partition Change Tracking table)
+_SITE_PARTITIONS = {
+    'CDD': ('MV_CDD_SITE', 'PCT_CDD_SITE'),
+    'SFLD': ('MV_SFLD_SITE', 'PCT_SFLD_SITE')
+}
+
 
 def compare_ispro_ippro(db_user, db_passwd, db_host, **kwargs):
     smtp_host = kwargs.get('smtp_host')
@@ -44,7 +49,7 @@ def compare_ispro_ippro(db_user, db_passwd, db_host, **kwargs):
         'uaread': None
     }
 
-    with cx_Oracle.connect(db_user, db_passwd, db_host) as con:
+    with utils.connect(db_user, db_passwd, db_host) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -350,7 +355,7 @@ def refresh_mv_iprscan(user, passwd, host, method='C', **kwargs):
         logging.critical('error while refreshing PCT table')
         return False
 
-    with cx_Oracle.connect(user, passwd, host) as con:
+    with utils.connect(user, passwd, host) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -428,68 +433,32 @@ def refresh_mv_iprscan(user, passwd, host, method='C', **kwargs):
     return True
 
 
-def refresh_site(user, passwd, host, method='C', **kwargs):
-    workdir = kwargs.get('workdir', os.getcwd())
-    queue = kwargs.get('queue')
-    parallel = kwargs.get('parallel', 1)
-
-    # Refreshing MV tables
-    logging.info('refreshing materialized views')
+def get_site_partitions():
+    return sorted(_SITE_PARTITIONS)
 
-    tasks = [
-        Task(
-            fn=utils.refresh_materialized_view,
-            args=(user, passwd, host, 'MV_CDD_SITE', method),
-            lsf=dict(name='MV_CDD_SITE'),
-            log=False
-        ),
-        Task(
-            fn=utils.refresh_materialized_view,
-            args=(user, passwd, host, 'MV_SFLD_SITE', method),
-            lsf=dict(name='MV_SFLD_SITE'),
-            log=False
-        )
-    ]
 
-    batch = Batch(tasks, dir=workdir)
+def refresh_site_partition(partition, user, passwd, host, method='C'):
+    # Refresh the materialized view, then the Partition Change Tracking table of one partition of IPRSCAN.SITE
+    mview, pct_table = _SITE_PARTITIONS[partition]
+    utils.refresh_materialized_view(user, passwd, host, mview, method)
 
-    if not batch.start().wait().is_done():
-        logging.critical('error while refreshing materialized views')
-        return False
+    logging.info('refreshing {}'.format(pct_table))
+    if partition == 'CDD':
+        _refresh_pct_cdd_site(user, passwd, host)
+    else:
+        _refresh_pct_sfld_site(user, passwd, host)
 
-    # Refresh Partition Change Tracking tables
-    logging.info('refreshing PCT tables')
-    tasks = [
-        Task(
-            fn=_refresh_pct_cdd_site,
-            args=(user, passwd, host),
-            lsf=dict(name='CDD_SITE'),
-            log=False
-        ),
-        Task(
-            fn=_refresh_pct_sfld_site,
-            args=(user, passwd, host),
-            lsf=dict(name='SFLD_SITE'),
-            log=False
-        )
-    ]
+    return partition
 
-    batch = Batch(tasks, dir=workdir)
-    if not batch.start().wait().is_done():
-        logging.critical('error while refreshing PCT table')
-        return False
 
-    with cx_Oracle.connect(user, passwd, host) as con:
+def exchange_site_partitions(partitions, user, passwd, host, parallel=1):
+    with utils.connect(user, passwd, host) as con:
         con.autocommit = 0
         cur = con.cursor()
 
         # Swap partitions
-        databases = [
-            ('CDD', 'PCT_CDD_SITE'),
-            ('SFLD', 'PCT_SFLD_SITE'),
-        ]
-
-        for partition, table in databases:
+        for partition in partitions:
+            mview, table = _SITE_PARTITIONS[partition]
             logging.info('update partition {} in IPRSCAN.SITE'.format(partition))
             cur.execute('ALTER TABLE IPRSCAN.SITE '
                         'EXCHANGE PARTITION {} WITH TABLE {} '
@@ -510,12 +479,39 @@ def refresh_site(user, passwd, host, method='C', **kwargs):
     return True
 
 
+def refresh_site(user, passwd, host, method='C', **kwargs):
+    workdir = kwargs.get('workdir', os.getcwd())
+    parallel = kwargs.get('parallel', 1)
+
+    # Refreshing MV tables, then PCT tables (one task per partition)
+    logging.info('refreshing materialized views and PCT tables')
+
+    tasks = [
+        Task(
+            fn=refresh_site_partition,
+            args=(partition, user, passwd, host, method),
+            lsf=dict(name='{}_SITE'.format(partition)),
+            log=False
+        )
+        for partition in get_site_partitions()
+    ]
+
+    batch = Batch(tasks, dir=workdir)
+
+    if not batch.start().wait().is_done():
+        logging.critical('error while refreshing materialized views/PCT tables')
+        return False
+
+    return exchange_site_partitions(get_site_partitions(), user, passwd, host, parallel)
+
+
 def refresh(db_user, db_passwd, db_host, **kwargs):
     method = kwargs.get('method', 'C')
     parallel = kwargs.get('parallel', 1)
     queue = kwargs.get('queue')
     workdir = kwargs.get('workdir', os.getcwd())
     lsf_log = kwargs.get('log', False)
+    site = kwargs.get('site', True)
 
     b = refresh_mv_iprscan(
         db_user, db_passwd, db_host, method,
@@ -525,19 +521,20 @@ def refresh(db_user, db_passwd, db_host, **kwargs):
     if not b:
         return False
 
-    b = refresh_site(
-        db_user, db_passwd, db_host, method,
-        workdir=workdir, queue=queue, parallel=parallel
-    )
+    if site:
+        b = refresh_site(
+            db_user, db_passwd, db_host, method,
+            workdir=workdir, queue=queue, parallel=parallel
+        )
 
-    if not b:
-        return False
+        if not b:
+            return False
 
     return True
 
 
 def protein2scan(db_user, db_passwd, db_host):
-    with cx_Oracle.connect(db_user, db_passwd, db_host) as con:
+    with utils.connect(db_user, db_passwd, db_host) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -577,7 +574,7 @@ def check(db_user_pro, db_passwd_pro, db_host, **kwargs):
     to_addrs = kwargs.get('to_addrs', [])
 
     is_ready = True
-    with cx_Oracle.connect(db_user_pro, db_passwd_pro, db_host) as con:
+    with utils.connect(db_user_pro, db_passwd_pro, db_host) as con:
         cur = con.cursor()
 
         logging.info('generating IPRSCAN health check report')
@@ -687,7 +684,7 @@ def check(db_user_pro, db_passwd_pro, db_host, **kwargs):
 
 
 def recreate_aa_iprscan(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -803,7 +800,7 @@ def recreate_aa_iprscan(user, passwd, db):
 
 
 def _refresh_pct_blast_prodom(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -844,7 +841,7 @@ def _refresh_pct_blast_prodom(user, passwd, db):
 
 
 def _refresh_pct_cdd_site(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -868,7 +865,7 @@ def _refresh_pct_cdd_site(user, passwd, db):
 
 
 def _refresh_pct_coils(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -911,7 +908,7 @@ def _refresh_pct_coils(user, passwd, db):
 
 
 def _refresh_pct_gene3d(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -954,7 +951,7 @@ def _refresh_pct_gene3d(user, passwd, db):
 
 
 def _refresh_pct_hamap(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -997,7 +994,7 @@ def _refresh_pct_hamap(user, passwd, db):
 
 
 def _refresh_pct_mobidb_lite(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1040,7 +1037,7 @@ def _refresh_pct_mobidb_lite(user, passwd, db):
 
 
 def _refresh_pct_panther(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1081,7 +1078,7 @@ def _refresh_pct_panther(user, passwd, db):
 
 
 def _refresh_pct_pfam(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1124,7 +1121,7 @@ def _refresh_pct_pfam(user, passwd, db):
 
 
 def _refresh_pct_phobius(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1165,7 +1162,7 @@ def _refresh_pct_phobius(user, passwd, db):
 
 
 def _refresh_pct_pirsf(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1208,7 +1205,7 @@ def _refresh_pct_pirsf(user, passwd, db):
 
 
 def _refresh_pct_prints(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1249,7 +1246,7 @@ def _refresh_pct_prints(user, passwd, db):
 
 
 def _refresh_pct_prosite_patterns(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1292,7 +1289,7 @@ def _refresh_pct_prosite_patterns(user, passwd, db):
 
 
 def _refresh_pct_prosite_profiles(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1335,7 +1332,7 @@ def _refresh_pct_prosite_profiles(user, passwd, db):
 
 
 def _refresh_pct_rpblast(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1377,7 +1374,7 @@ def _refresh_pct_rpblast(user, passwd, db):
 
 
 def _refresh_pct_sfld(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1420,7 +1417,7 @@ def _refresh_pct_sfld(user, passwd, db):
 
 
 def _refresh_pct_sfld_site(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1444,7 +1441,7 @@ def _refresh_pct_sfld_site(user, passwd, db):
 
 
 def _refresh_pct_signalp(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1498,7 +1495,7 @@ def _refresh_pct_signalp(user, passwd, db):
 
 
 def _refresh_pct_smart(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1541,7 +1538,7 @@ def _refresh_pct_smart(user, passwd, db):
 
 
 def _refresh_pct_superfamily(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1582,7 +1579,7 @@ def _refresh_pct_superfamily(user, passwd, db):
 
 
 def _refresh_pct_tigrfam(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1625,7 +1622,7 @@ def _refresh_pct_tigrfam(user, passwd, db):
 
 
 def _refresh_pct_tmhmm(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1674,7 +1671,7 @@ def report_swissprot_changes(user, passwd, db, updates, prefix='swiss_de_report_
         databases[dbcode] = (int(last_id), int(new_id))
         analyses += [int(last_id), int(new_id)]
 
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
         cur.execute(
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+
+import h5py
+import numpy as np
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s: %(levelname)s: %(message)s',
+    datefmt='%y-%m-%d %H:%M:%S'
+)
+
+# Columns of the 'proteins' group copied into the index
+COLUMNS = ('ac', 'name', 'dbcode', 'isfrag', 'crc64', 'len', 'taxid', 'year', 'month', 'day')
+
+
+def _set_sorted(grp, key):
+    """Flags an HDF5 group as having its datasets sorted by the *key* dataset."""
+    grp.attrs['is_sorted'] = True
+    grp.attrs['sorted_by'] = key
+
+
+def _is_sorted(grp, key):
+    """Returns ``True`` if the datasets of an HDF5 group are sorted by the *key* dataset."""
+    if not grp.attrs.get('is_sorted', False):
+        return False
+
+    sorted_by = grp.attrs.get('sorted_by')
+    if isinstance(sorted_by, bytes):
+        sorted_by = sorted_by.decode()
+
+    return sorted_by == key
+
+
+def build_index(h5file, outdir):
+    """Builds an accession index from an HDF5 file created by ``ipu.proteins.read_flat_file()`` or ``merge_h5()``.
+
+    Each column is stored as a NumPy file in *outdir*, sorted by accession, so it can be memory-mapped.
+    Secondary accessions are stored sorted, alongside their primary accession.
+
+    :param h5file: path to the HDF5 file (e.g. uniprot.h5).
+    :param outdir: output directory.
+    :return: number of proteins, and number of pairs.
+    :rtype: tuple
+    """
+    try:
+        os.makedirs(outdir)
+    except FileExistsError:
+        pass
+
+    logging.info('building index from {}'.format(h5file))
+    with h5py.File(h5file, 'r') as fh:
+        grp = fh['proteins']
+        ac = grp['ac'].value
+
+        if _is_sorted(grp, 'ac'):
+            x = slice(None)
+        else:
+            x = np.argsort(ac, kind='mergesort')
+
+        for col in COLUMNS:
+            if col in grp:
+                np.save(os.path.join(outdir, col + '.npy'), grp[col].value[x])
+
+        n_proteins = ac.size
+
+        grp = fh['pairs']
+        sec = grp['sec'].value
+
+        if _is_sorted(grp, 'sec'):
+            x = slice(None)
+        else:
+            x = np.argsort(sec, kind='mergesort')
+
+        np.save(os.path.join(outdir, 'sec.npy'), sec[x])
+        np.save(os.path.join(outdir, 'sec_ac.npy'), grp['ac'].value[x])
+        n_pairs = sec.size
+
+    logging.info('{} proteins and {} pairs indexed in {}'.format(n_proteins, n_pairs, outdir))
+    return n_proteins, n_pairs
+
+
+class AccessionIndex(object):
+    """Read-only, memory-mapped view over an index built by :py:func:`build_index`.
+
+    :param path: directory of the index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._arrays = {}
+
+    def _get(self, col):
+        try:
+            arr = self._arrays[col]
+        except KeyError:
+            arr = self._arrays[col] = np.load(os.path.join(self.path, col + '.npy'), mmap_mode='r')
+
+        return arr
+
+    @property
+    def columns(self):
+        return [col for col in COLUMNS if os.path.isfile(os.path.join(self.path, col + '.npy'))]
+
+    def __len__(self):
+        return self._get('ac').size
+
+    def __contains__(self, accession):
+        return self.find(accession) >= 0
+
+    @staticmethod
+    def _encode(accessions):
+        if isinstance(accessions, (str, bytes)):
+            accessions = [accessions]
+
+        return np.array([ac.encode() if isinstance(ac, str) else ac for ac in accessions], dtype='S15')
+
+    def find(self, accession):
+        """Returns the position of an accession in the index, or -1 if the accession is not indexed.
+
+        :param accession: protein accession.
+        :rtype: int
+        """
+        return int(self.find_many(accession)[0])
+
+    def find_many(self, accessions):
+        """Returns the positions of accessions in the index (-1 for accessions not indexed).
+
+        :param accessions: list of protein accessions.
+        :rtype: numpy.ndarray
+        """
+        keys = self._encode(accessions)
+        ac = self._get('ac')
+
+        idx = np.searchsorted(ac, keys)
+        idx[idx == ac.size] = 0
+        if ac.size:
+            found = ac[idx] == keys
+        else:
+            found = np.zeros(keys.size, dtype=bool)
+
+        return np.where(found, idx, -1)
+
+    def get(self, accession):
+        """Returns the properties of a protein, or ``None`` if the accession is not indexed.
+
+        :param accession: protein accession.
+        :rtype: dict
+        """
+        return self.get_many([accession])[0]
+
+    def get_many(self, accessions):
+        """Returns the properties of several proteins (``None`` for accessions not indexed).
+
+        :param accessions: list of protein accessions.
+        :rtype: list
+        """
+        idx = self.find_many(accessions)
+        found = idx >= 0
+
+        values = {}
+        for col in self.columns:
+            values[col] = self._get(col)[idx[found]].tolist()
+
+        results = []
+        j = 0
+        for is_found in found:
+            if is_found:
+                obj = {}
+                for col, val in values.items():
+                    val = val[j]
+                    obj[col] = val.decode() if isinstance(val, bytes) else val
+
+                results.append(obj)
+                j += 1
+            else:
+                results.append(None)
+
+        return results
+
+    def primary(self, secondary):
+        """Returns the primary accessions a secondary accession is associated to.
+
+        :param secondary: secondary accession.
+        :rtype: list
+        """
+        return self.primary_many([secondary])[0]
+
+    def primary_many(self, secondaries):
+        """Returns the primary accessions of several secondary accessions.
+
+        :param secondaries: list of secondary accessions.
+        :rtype: list
+        """
+        keys = self._encode(secondaries)
+        sec = self._get('sec')
+        sec_ac = self._get('sec_ac')
+
+        left = np.searchsorted(sec, keys, side='left')
+        right = np.searchsorted(sec, keys, side='right')
+
+        return [[ac.decode() for ac in sec_ac[i:j].tolist()] for i, j in zip(left, right)]
@@ -3,8 +3,6 @@
 
 import logging
 
-import cx_Oracle
-
 from . import utils, xref
 
 
@@ -105,7 +103,7 @@ def prepare_matches(db_user, db_passwd, db_host, **kwargs):
 
 
 def add_new_matches(user, passwd, db, chunksize=100000):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
         cur2 = con.cursor()
@@ -221,7 +219,7 @@ def update_matches(user, passwd, db):
 
 
 def delete_match(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -238,7 +236,7 @@ def delete_match(user, passwd, db):
 
 
 def insert_match(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -250,7 +248,7 @@ def insert_match(user, passwd, db):
 
 
 def pre_prod(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -498,7 +496,7 @@ def finalize(method_changes, db_user, db_passwd, db_host, **kwargs):
             to_addrs=to_addrs_1
         )
 
-    with cx_Oracle.connect(db_user, db_passwd, db_host) as con:
+    with utils.connect(db_user, db_passwd, db_host) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -588,7 +586,7 @@ def finalize(method_changes, db_user, db_passwd, db_host, **kwargs):
 
 
 def refresh_interpro2go(db_user, db_passwd, db_host):
-    with cx_Oracle.connect(db_user, db_passwd, db_host) as con:
+    with utils.connect(db_user, db_passwd, db_host) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -602,7 +600,7 @@ def refresh_interpro2go(db_user, db_passwd, db_host):
 
 
 def update_site_matches(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -3,7 +3,7 @@
 
 import logging
 
-import cx_Oracle
+from . import utils
 
 
 logging.basicConfig(
@@ -14,7 +14,7 @@ logging.basicConfig(
 
 
 def find_changes(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         cur = con.cursor()
 
         """
@@ -2,16 +2,19 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import glob
+import json
 import logging
 import os
+import time
 
-import cx_Oracle
 import h5py
 import numpy as np
 import pyswiss
 from mundone import Batch, Task
 
 from . import utils
+from .lookup import _is_sorted, _set_sorted
 
 
 logging.basicConfig(
@@ -20,12 +23,23 @@ logging.basicConfig(
     datefmt='%y-%m-%d %H:%M:%S'
 )
 
+# Default throughputs (rows/s) used to predict the cost of each strategy of delete()
+DELETE_RATES = dict(delete=2000, copy=200000, reload=50000)
+
+# Tables storing protein accessions, but not necessarily referencing INTERPRO.PROTEIN with a foreign key
+_OTHER_TABLES = ('MATCH_NEW', 'FEATURE_MATCH_NEW', 'MV_ENTRY2PROTEIN', 'MV_ENTRY2PROTEIN_TRUE', 'MV_METHOD2PROTEIN',
+                 'PROTEIN_ACCPAIR_NEW', 'SITE_MATCH_NEW', 'SUPERMATCH')
+
 
 def read_flat_file(filename, output):
     logging.info('reading {}'.format(filename))
     new_proteins, new_pairs = pyswiss.load(filename)
     logging.info('{} proteins and {} pairs read'.format(new_proteins.size, new_pairs.size))
 
+    # Sort proteins by accession, and pairs by secondary accession
+    new_proteins = new_proteins[np.argsort(new_proteins['ac'], kind='mergesort')]
+    new_pairs = new_pairs[np.argsort(new_pairs['sec'], kind='mergesort')]
+
     logging.info('writing to {}'.format(output))
     with h5py.File(output, 'w') as fh:
         grp = fh.create_group('proteins')
@@ -39,17 +53,19 @@ def read_flat_file(filename, output):
         grp.create_dataset('year', data=new_proteins['year'], compression='gzip')
         grp.create_dataset('month', data=new_proteins['month'], compression='gzip')
         grp.create_dataset('day', data=new_proteins['day'], compression='gzip')
+        _set_sorted(grp, 'ac')
 
         grp = fh.create_group('pairs')
         grp.create_dataset('ac', data=new_pairs['ac'], compression='gzip')
         grp.create_dataset('sec', data=new_pairs['sec'], compression='gzip')
+        _set_sorted(grp, 'sec')
 
     return int(new_proteins.size)
 
 
 def dump_proteins(user, passwd, db, output):
     logging.info('loading proteins from INTERPRO.PROTEIN')
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         cur = con.cursor()
         cur.execute('SELECT COUNT(*) FROM INTERPRO.PROTEIN')
         cnt = cur.fetchone()[0]
@@ -70,6 +86,9 @@ def dump_proteins(user, passwd, db, output):
 
         logging.info('{} proteins loaded'.format(proteins.size))
 
+    # Sort in NumPy rather than with ORDER BY, as Oracle's collation may differ from byte order
+    proteins = proteins[np.argsort(proteins['ac'], kind='mergesort')]
+
     logging.info('writing to {}'.format(output))
     with h5py.File(output, 'w') as fh:
         grp = fh.create_group('proteins')
@@ -80,32 +99,66 @@ def dump_proteins(user, passwd, db, output):
         grp.create_dataset('crc64', data=proteins['crc64'].astype('S16'), compression='gzip')
         grp.create_dataset('len', data=proteins['len'], compression='gzip')
         grp.create_dataset('taxid', data=proteins['taxid'], compression='gzip')
+        _set_sorted(grp, 'ac')
+
+
+def get_checksum(user, passwd, db):
+    # Number of proteins, and checksum of the columns exported by dump_proteins()
+    with utils.connect(user, passwd, db) as con:
+        cur = con.cursor()
+        cur.execute(
+            """
+            SELECT COUNT(*), SUM(ORA_HASH(
+              PROTEIN_AC || '|' || NAME || '|' || DBCODE || '|' || FRAGMENT || '|' || CRC64 || '|' || LEN || '|' || TAX_ID
+            ))
+            FROM INTERPRO.PROTEIN
+            """
+        )
+        row = cur.fetchone()
+        cur.close()
+
+    return row
 
 
 def merge_h5(inputs, output):
     handlers = [h5py.File(f, 'r') for f in inputs]
 
     with h5py.File(output, 'w') as fho:
+        # Indices that would sort the concatenated accessions
+        x = np.argsort(np.concatenate([fh['proteins/ac'].value for fh in handlers]), kind='mergesort')
+
         grp = fho.create_group('proteins')
         for dset in ('ac', 'name', 'dbcode', 'isfrag', 'crc64', 'len', 'taxid', 'year', 'month', 'day'):
             grp.create_dataset(
                 dset,
-                data=np.concatenate([fh['proteins/' + dset].value for fh in handlers]),
+                data=np.concatenate([fh['proteins/' + dset].value for fh in handlers])[x],
                 compression='gzip'
             )
+        _set_sorted(grp, 'ac')
+
+        x = np.argsort(np.concatenate([fh['pairs/sec'].value for fh in handlers]), kind='mergesort')
 
         grp = fho.create_group('pairs')
         for dset in ('ac', 'sec'):
             grp.create_dataset(
                 dset,
-                data=np.concatenate([fh['pairs/' + dset].value for fh in handlers]),
+                data=np.concatenate([fh['pairs/' + dset].value for fh in handlers])[x],
                 compression='gzip'
             )
+        _set_sorted(grp, 'sec')
 
     for fh in handlers:
         fh.close()
 
 
+def _unique_sorted(a):
+    """Returns the unique elements of a sorted array (single adjacent-compare pass)."""
+    if not a.size:
+        return a
+
+    return a[np.concatenate(([True], a[1:] != a[:-1]))]
+
+
 def insert(old_h5, new_h5, db_user, db_passwd, db_host, **kwargs):
     chunksize = kwargs.get('chunksize', 1000000)
 
@@ -122,36 +175,77 @@ def insert(old_h5, new_h5, db_user, db_passwd, db_host, **kwargs):
         new_ac = fh2['proteins/ac'].value
         new_sec = fh2['pairs/sec'].value
 
-        if new_ac.size != np.unique(new_ac).size:
-            logging.critical('duplicated entries in {}'.format(new_ac))
+        presorted = (
+            _is_sorted(fh1['proteins'], 'ac')
+            and _is_sorted(fh2['proteins'], 'ac')
+            and _is_sorted(fh2['pairs'], 'sec')
+        )
+
+        if presorted:
+            logging.info('input files are sorted by accession')
+            has_duplicates = bool(np.any(new_ac[1:] == new_ac[:-1]))
+        else:
+            has_duplicates = new_ac.size != np.unique(new_ac).size
+
+        if has_duplicates:
+            logging.critical('duplicated entries in {}'.format(new_h5))
             exit(1)
 
-        # Find deleted proteins
-        logging.info('finding deleted proteins')
-        deleted = np.setdiff1d(np.setdiff1d(old_ac, new_ac, assume_unique=True), new_sec, assume_unique=True)
-        changes['deleted'] = deleted.size
-        logging.info('{} deleted proteins'.format(deleted.size))
-
-        # Find newly merged proteins
-        logging.info('finding merged proteins')
-        merged = np.intersect1d(np.setdiff1d(new_sec, new_ac, assume_unique=True), old_ac, assume_unique=True)
-        changes['merged'] = merged.size
-        logging.info('{} merged proteins'.format(merged.size))
-
-        # Find new proteins
-        logging.info('finding new proteins')
-        new = np.setdiff1d(new_ac, old_ac, assume_unique=True)
-        changes['new'] = new.size
-        logging.info('{} new proteins'.format(merged.size))
-
-        # Find indices for non-new proteins in both arrays
-        logging.info('joining/sorting proteins')
-        mask1 = np.in1d(old_ac, new_ac, assume_unique=True)
-        mask2 = np.in1d(new_ac, old_ac, assume_unique=True)
-
-        # Get the indices that would sort the arrays such as old_ac[mask1][x1] = new_ac[mask2][x2]
-        x1 = np.argsort(old_ac[mask1])
-        x2 = np.argsort(new_ac[mask2])
+        if presorted:
+            # A secondary accession may be associated to several primary accessions
+            new_sec = _unique_sorted(new_sec)
+
+            mask1 = utils.isin_sorted(old_ac, new_ac)
+            mask2 = utils.isin_sorted(new_ac, old_ac)
+
+            # Find deleted proteins
+            logging.info('finding deleted proteins')
+            deleted = old_ac[~mask1 & ~utils.isin_sorted(old_ac, new_sec)]
+            changes['deleted'] = deleted.size
+            logging.info('{} deleted proteins'.format(deleted.size))
+
+            # Find newly merged proteins
+            logging.info('finding merged proteins')
+            merged = new_sec[~utils.isin_sorted(new_sec, new_ac)]
+            merged = merged[utils.isin_sorted(merged, old_ac)]
+            changes['merged'] = merged.size
+            logging.info('{} merged proteins'.format(merged.size))
+
+            # Find new proteins
+            logging.info('finding new proteins')
+            new = new_ac[~mask2]
+            changes['new'] = new.size
+            logging.info('{} new proteins'.format(new.size))
+
+            # Arrays are already sorted: old_ac[mask1] = new_ac[mask2]
+            x1 = x2 = slice(None)
+        else:
+            # Find deleted proteins
+            logging.info('finding deleted proteins')
+            deleted = np.setdiff1d(np.setdiff1d(old_ac, new_ac, assume_unique=True), new_sec, assume_unique=True)
+            changes['deleted'] = deleted.size
+            logging.info('{} deleted proteins'.format(deleted.size))
+
+            # Find newly merged proteins
+            logging.info('finding merged proteins')
+            merged = np.intersect1d(np.setdiff1d(new_sec, new_ac, assume_unique=True), old_ac, assume_unique=True)
+            changes['merged'] = merged.size
+            logging.info('{} merged proteins'.format(merged.size))
+
+            # Find new proteins
+            logging.info('finding new proteins')
+            new = np.setdiff1d(new_ac, old_ac, assume_unique=True)
+            changes['new'] = new.size
+            logging.info('{} new proteins'.format(new.size))
+
+            # Find indices for non-new proteins in both arrays
+            logging.info('joining/sorting proteins')
+            mask1 = np.in1d(old_ac, new_ac, assume_unique=True)
+            mask2 = np.in1d(new_ac, old_ac, assume_unique=True)
+
+            # Get the indices that would sort the arrays such as old_ac[mask1][x1] = new_ac[mask2][x2]
+            x1 = np.argsort(old_ac[mask1])
+            x2 = np.argsort(new_ac[mask2])
 
         old_ac = old_ac[mask1][x1]
 
@@ -182,7 +276,11 @@ def insert(old_h5, new_h5, db_user, db_passwd, db_host, **kwargs):
 
         # Find changed proteins to discard unchanged ones
         logging.info('discarding unchanged proteins')
-        mask = np.in1d(new_ac, np.concatenate((deleted, merged, new, seq_changes, anno_changes)), assume_unique=True)
+        changed = np.concatenate((deleted, merged, new, seq_changes, anno_changes))
+        if presorted:
+            mask = utils.isin_sorted(new_ac, np.sort(changed))
+        else:
+            mask = np.in1d(new_ac, changed, assume_unique=True)
 
         new_proteins = np.empty(np.sum(mask), dtype=[
             ('ac', 'S15'), ('name', 'S16'), ('dbcode', 'S1'), ('isfrag', 'S1'), ('crc64', 'S16'),
@@ -196,7 +294,7 @@ def insert(old_h5, new_h5, db_user, db_passwd, db_host, **kwargs):
         new_pairs['ac'] = fh2['pairs/ac'].value
         new_pairs['sec'] = fh2['pairs/sec'].value
 
-    with cx_Oracle.connect(db_user, db_passwd, db_host) as con:
+    with utils.connect(db_user, db_passwd, db_host) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -277,6 +375,8 @@ def update_prod_tables(cnt_swiss, cnt_trembl, user, passwd, host, rel_version, r
         delete(user, passwd, host,
                outdir=os.path.join(outdir, 'delete'),
                queue=queue,
+               strategy=kwargs.get('strategy', 'delete'),
+               count=kwargs.get('count', True),
                workdir=workdir)
     else:
         delete_alt(user, passwd, host, workdir=workdir, queue=queue)
@@ -287,7 +387,12 @@ def update_prod_tables(cnt_swiss, cnt_trembl, user, passwd, host, rel_version, r
 
 
 def delete(user, passwd, db, **kwargs):
+    count = kwargs.get('count', True)
+    strategy = kwargs.get('strategy', 'delete')
+    rates = dict(DELETE_RATES, **kwargs.get('rates', {}))
     chunksize = kwargs.get('chunksize', 100000)
+    target_secs = kwargs.get('target_secs', 60)
+    max_workers = kwargs.get('max_workers', 16)
     logdir = kwargs.get('outdir')
     queue = kwargs.get('queue')
     workdir = kwargs.get('workdir', os.getcwd())
@@ -299,7 +404,7 @@ def delete(user, passwd, db, **kwargs):
     except:
         logdir = None
 
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -307,14 +412,24 @@ def delete(user, passwd, db, **kwargs):
         cur.execute('TRUNCATE TABLE INTERPRO.DELETE_PROTEIN_STG')
         con.commit()
 
+        # IDs are assigned in accession order, so a rerun assigns the same IDs (required to resume deletions)
         logging.info('populating INTERPRO.DELETE_PROTEIN_STG')
         cur.execute("INSERT INTO INTERPRO.DELETE_PROTEIN_STG "
                     "SELECT OLD_PROTEIN_AC, ROWNUM ID "
-                    "FROM INTERPRO.PROTEIN_CHANGES "
-                    "WHERE FLAG IN ('D', 'M')")
+                    "FROM ("
+                    "  SELECT OLD_PROTEIN_AC "
+                    "  FROM INTERPRO.PROTEIN_CHANGES "
+                    "  WHERE FLAG IN ('D', 'M') "
+                    "  ORDER BY OLD_PROTEIN_AC"
+                    ")")
         cnt_to_delete_all = cur.rowcount
         con.commit()
 
+        # Identifies the content of DELETE_PROTEIN_STG in progress files
+        cur.execute("SELECT MIN(OLD_PROTEIN_AC), MAX(OLD_PROTEIN_AC) "
+                    "FROM INTERPRO.DELETE_PROTEIN_STG")
+        progress_key = [cnt_to_delete_all] + list(cur.fetchone())
+
         cur.execute("SELECT OWNER, TABLE_NAME, CONSTRAINT_NAME "
                     "FROM ALL_CONSTRAINTS "
                     "WHERE CONSTRAINT_TYPE='R' "
@@ -325,44 +440,69 @@ def delete(user, passwd, db, **kwargs):
                     "  AND OWNER='INTERPRO' "
                     "  AND TABLE_NAME='PROTEIN'"
                     ")")
-        tables = cur.fetchall()
-
-    tables = [dict(zip(['owner', 'name', 'constraint'], t)) for t in tables]
+        tables = [dict(zip(['owner', 'name', 'constraint'], t)) for t in cur.fetchall()]
+
+        # Number of rows from optimizer statistics (None if the table has never been analyzed)
+        sizes = {}
+        for t in tables + [dict(owner='INTERPRO', name='PROTEIN')]:
+            cur.execute("SELECT NUM_ROWS "
+                        "FROM ALL_TABLES "
+                        "WHERE OWNER = :1 AND TABLE_NAME = :2", (t['owner'], t['name']))
+            row = cur.fetchone()
+            sizes[t['name']] = row[0] if row else None
+
+        # SQL*Loader specifications of tables that can be reloaded
+        specs = _get_loader_specs(cur, [(t['owner'], t['name']) for t in tables] + [('INTERPRO', 'PROTEIN')])
+
+        # Tables truncated by an interrupted copy or reload: rows are copied back before counting
+        for t in tables + [dict(owner='INTERPRO', name='PROTEIN')]:
+            utils.resume_staging(con, t['owner'], t['name'], utils.get_staging_name(t['name']))
+
+    all_tables = tables + [dict(owner='INTERPRO', name='PROTEIN')]
+    if count:
+        # Count rows to be deleted
+        logging.info('counting rows to be deleted')
+        tasks = []
+        for t in tables:
+            tasks.append(
+                Task(
+                    fn=_count_proteins_to_delete,
+                    args=(user, passwd, db, t['owner'], t['name']),
+                    lsf=dict(name=t['name'], queue=queue),
+                    log=False,
+                    thread=True
+                )
+            )
 
-    # Count rows to be deleted
-    logging.info('counting rows to be deleted')
-    tasks = []
-    for t in tables:
         tasks.append(
             Task(
                 fn=_count_proteins_to_delete,
-                args=(user, passwd, db, t['owner'], t['name']),
-                lsf=dict(name=t['name'], queue=queue),
-                log=False
+                args=(user, passwd, db, 'INTERPRO', 'PROTEIN'),
+                lsf=dict(name='PROTEIN', queue=queue),
+                log=False,
+                thread=True
             )
         )
 
-    tasks.append(
-        Task(
-            fn=_count_proteins_to_delete,
-            args=(user, passwd, db, 'INTERPRO', 'PROTEIN'),
-            lsf=dict(name='PROTEIN', queue=queue),
-            log=False
-        )
-    )
-
-    batch = Batch(tasks, dir=workdir)
-    if not batch.start().wait().is_done():
-        logging.critical('one or more tasks failed')
-        exit(1)
-
-    counts = dict(zip(
-        [t['name'] for t in tables] + ['PROTEIN'],  # key: name of table
-        batch.results                               # val: num of proteins to delete
-    ))
+        batch = Batch(tasks, dir=workdir)
+        if not batch.start().wait().is_done():
+            logging.critical('one or more tasks failed')
+            exit(1)
 
-    if any(counts.values()):
-        with cx_Oracle.connect(user, passwd, db) as con:
+        counts = dict(zip(
+            [t['name'] for t in tables] + ['PROTEIN'],  # key: name of table
+            batch.results                               # val: num of proteins to delete
+        ))
+        todo = [name for name, cnt in counts.items() if cnt]
+    else:
+        # Rows are not counted: the number of deleted rows is reported by the DELETE statements,
+        # and tables are probed for remaining proteins afterwards
+        counts = {}
+        todo = [t['name'] for t in all_tables] if cnt_to_delete_all else []
+
+    removed = {}
+    if todo:
+        with utils.connect(user, passwd, db) as con:
             con.autocommit = 0
             cur = con.cursor()
 
@@ -378,35 +518,110 @@ def delete(user, passwd, db, **kwargs):
 
             con.commit()
 
+        # Pick a strategy for each table
+        if strategy == 'auto':
+            strategies = ('delete', 'copy', 'reload')
+        else:
+            strategies = (strategy,)
+
+        if count:
+            plan = _plan_deletes(counts, sizes, rates, strategies, loadable=specs)
+
+            logging.info('deletion plan:')
+            for t in all_tables:
+                if t['name'] in plan:
+                    method, secs = plan[t['name']]
+                    logging.info('  {:<25}: {:<6} {:>10} of {:>12} rows, predicted: {:.0f} s'.format(
+                        t['name'], method, counts[t['name']], sizes[t['name']] if sizes[t['name']] is not None else '?',
+                        secs
+                    ))
+
+            logging.info('predicted duration: {:.0f} s'.format(max(secs for method, secs in plan.values())))
+        else:
+            # Costs cannot be predicted without counts: chunked deletes only
+            plan = {name: ('delete', None) for name in todo}
+
+        if any(method == 'reload' for method, secs in plan.values()):
+            with utils.connect(user, passwd, db) as con:
+                cur = con.cursor()
+                cur.execute('SELECT OLD_PROTEIN_AC FROM INTERPRO.DELETE_PROTEIN_STG')
+                deleted = os.path.join(workdir, 'deleted.npy')
+                utils.write_exclusion_file([row[0] for row in cur], deleted)
+        else:
+            deleted = None
+
         # Delete rows
         logging.info('deleting rows')
+
+        # Share workers between tables according to the number of rows to delete (or to the size of tables)
+        weights = counts if count else {name: sizes[name] or 0 for name in todo}
+        workers = _share_workers({t: weights[t] for t in plan if plan[t][0] == 'delete'}, max_workers)
+
+        # Ranges of IDs chosen by an interrupted run are reused, so its workers find their progress
+        rangesfile = os.path.join(logdir, 'ranges.json') if logdir else None
+        all_ranges = _read_ranges(rangesfile, progress_key) if rangesfile else {}
+
+        names = []
         tasks = []
-        for t in tables:
-            if not counts[t['name']]:
+        for t in all_tables:
+            if t['name'] not in plan:
                 continue
 
-            logfile = os.path.join(logdir, t['name'] + '.log') if logdir else None
-            tasks.append(
-                Task(
-                    fn=_delete_iter,
-                    args=(user, passwd, db, t['owner'], t['name'], cnt_to_delete_all),
-                    kwargs=dict(chunksize=chunksize, logfile=logfile),
-                    lsf=dict(name=t['name'], queue=queue),
-                    log=False
+            method = plan[t['name']][0]
+            if method == 'copy':
+                names.append(t['name'])
+                tasks.append(
+                    Task(
+                        fn=_copy_without_deleted,
+                        args=(user, passwd, db, t['owner'], t['name']),
+                        lsf=dict(name=t['name'], queue=queue),
+                        log=False
+                    )
                 )
-            )
+                continue
+            elif method == 'reload':
+                names.append(t['name'])
+                tasks.append(
+                    Task(
+                        fn=_reload_without_deleted,
+                        args=(user, passwd, db, t['owner'], t['name'], specs[t['name']], counts[t['name']], deleted),
+                        lsf=dict(mem=4000, name=t['name'], queue=queue),
+                        log=False
+                    )
+                )
+                continue
 
-        if counts['PROTEIN']:
-            logfile = os.path.join(logdir, 'PROTEIN.log') if logdir else None
-            tasks.append(
-                Task(
-                    fn=_delete_iter,
-                    args=(user, passwd, db, 'INTERPRO', 'PROTEIN', cnt_to_delete_all),
-                    kwargs=dict(chunksize=chunksize, logfile=logfile),
-                    lsf=dict(name='PROTEIN', queue=queue),
-                    log=False
+            try:
+                ranges = all_ranges[t['name']]
+            except KeyError:
+                ranges = all_ranges[t['name']] = _split_ids(cnt_to_delete_all, workers[t['name']])
+
+            logging.info('  {:<25}: {:>10} rows, {} worker(s)'.format(t['name'], counts.get(t['name'], '?'),
+                                                                      len(ranges)))
+
+            for k, (first_id, last_id) in enumerate(ranges):
+                if len(ranges) > 1:
+                    prefix = '{}.{}'.format(t['name'], k)
+                else:
+                    prefix = t['name']
+
+                logfile = os.path.join(logdir, prefix + '.log') if logdir else None
+                progress = os.path.join(logdir, prefix + '.progress') if logdir else None
+                names.append(t['name'])
+                tasks.append(
+                    Task(
+                        fn=_delete_iter,
+                        args=(user, passwd, db, t['owner'], t['name'], last_id),
+                        kwargs=dict(first_id=first_id, chunksize=chunksize, target_secs=target_secs,
+                                    logfile=logfile, progress=progress,
+                                    progress_key=progress_key + [first_id, last_id]),
+                        lsf=dict(name=prefix, queue=queue),
+                        log=False
+                    )
                 )
-            )
+
+        if rangesfile:
+            _write_ranges(rangesfile, progress_key, all_ranges)
 
         if tasks:
             batch = Batch(tasks, dir=workdir)
@@ -414,20 +629,35 @@ def delete(user, passwd, db, **kwargs):
                 logging.critical('one or more tasks failed')
                 exit(1)
 
-            counts2 = dict(zip(
-                [t['name'] for t in tables] + ['PROTEIN'],  # key: name of table
-                batch.results                               # val: num of proteins deleted
-            ))
+            for table, cnt in zip(names, batch.results):
+                removed[table] = removed.get(table, 0) + cnt
 
-            for table in counts:
-                counts[table] -= counts2.get(table, 0)
+        if deleted:
+            os.unlink(deleted)
 
-    if any(counts.values()):  # unexpected counts: some rows were not deleted
-        logging.critical('the following tables still contain deleted proteins: {}'.format(
-            ', '.join(["{} ({})".format(t, c) for t, c in counts.items() if c])
-        ))
+        for table in sorted(removed):
+            logging.info('  {:<25}: {:>10} rows deleted'.format(table, removed[table]))
+
+    if count:
+        # unexpected counts: some rows were not deleted
+        remaining = ["{} ({})".format(t, c - removed.get(t, 0)) for t, c in counts.items() if c != removed.get(t, 0)]
+    else:
+        remaining = _probe_proteins_to_delete(user, passwd, db, [(t['owner'], t['name']) for t in all_tables])
+
+    if remaining:
+        logging.critical('the following tables still contain deleted proteins: {}'.format(', '.join(remaining)))
         exit(1)
 
+    # All rows deleted: progress files are not needed anymore
+    if logdir:
+        for pathname in glob.glob(os.path.join(logdir, '*.progress')):
+            os.unlink(pathname)
+
+        try:
+            os.unlink(os.path.join(logdir, 'ranges.json'))
+        except FileNotFoundError:
+            pass
+
     logging.info('enabling constraints')
 
     # Enable all constraints of protein table
@@ -442,7 +672,8 @@ def delete(user, passwd, db, **kwargs):
                 args=(None, t['owner'], t['name'], t['constraint']),
                 kwargs=dict(enable=True, credentials=(user, passwd, db)),
                 lsf=dict(name=t['constraint'], queue=queue),
-                log=False
+                log=False,
+                thread=True
             )
         )
 
@@ -452,8 +683,141 @@ def delete(user, passwd, db, **kwargs):
         logging.error('one or more tasks failed')
 
 
+def _plan_deletes(counts, sizes, rates, strategies, loadable=()):
+    """Picks the cheapest strategy to remove deleted proteins from each table.
+
+    Predicted costs (in seconds) derive from the number of rows to delete (d),
+    the number of rows in the table (n), and the throughputs in *rates*:
+        * delete: chunked DELETE, d / rates['delete']
+        * copy: copy kept rows to a staging table, then back, (2n - d) / rates['copy']
+        * reload: dump kept rows and reload them with SQL*Loader, n / rates['reload']
+
+    Copy and reload require table statistics, and reload is only available for tables in *loadable*.
+    If no requested strategy is available, tables fall back to chunked DELETE.
+    """
+    plan = {}
+    for table, d in counts.items():
+        if not d:
+            continue
+
+        n = sizes.get(table)
+        costs = {}
+        if 'delete' in strategies:
+            costs['delete'] = d / rates['delete']
+
+        if n is not None:
+            n = max(n, d)  # statistics may be stale
+
+            if 'copy' in strategies:
+                costs['copy'] = (2 * n - d) / rates['copy']
+
+            if 'reload' in strategies and table in loadable:
+                costs['reload'] = n / rates['reload']
+
+        if not costs:
+            costs['delete'] = d / rates['delete']
+
+        method = min(costs, key=costs.get)
+        plan[table] = (method, costs[method])
+
+    return plan
+
+
+def _copy_without_deleted(user, passwd, db, owner, table):
+    """Removes deleted proteins by copying the other rows to a staging table, then back. Returns the number of rows removed."""
+    staging = utils.get_staging_name(table)
+
+    with utils.connect(user, passwd, db) as con:
+        con.autocommit = 0
+        cur = con.cursor()
+
+        cur.execute('SELECT /*+ PARALLEL */ COUNT(*) FROM {}.{}'.format(owner, table))
+        cnt_before = cur.fetchone()[0]
+
+        logging.info('copying rows from {}.{} to {}.{}'.format(owner, table, owner, staging))
+        utils.create_staging(con, owner, table, staging,
+                             where='NOT EXISTS ('
+                                   '  SELECT 1 '
+                                   '  FROM INTERPRO.DELETE_PROTEIN_STG S '
+                                   '  WHERE S.OLD_PROTEIN_AC = T.PROTEIN_AC'
+                                   ')')
+
+        cur.execute('SELECT /*+ PARALLEL */ COUNT(*) FROM {}.{}'.format(owner, staging))
+        cnt_after = cur.fetchone()[0]
+
+        utils.mark_staging_complete(con, owner, staging)
+        utils.reload_from_staging(con, owner, table, staging)
+
+    return cnt_before - cnt_after
+
+
+def _reload_without_deleted(user, passwd, db, owner, table, spec, cnt_to_delete, deleted):
+    """Removes deleted proteins by dumping the other rows and reloading them. Returns the number of rows removed."""
+    idx, columns = spec
+    pathname = os.path.join(os.path.dirname(deleted), table + '.dat')
+    utils.dump_and_load(user, passwd, db, owner, table, columns, pathname, exclude=deleted, idx=idx, stream=True)
+
+    return cnt_to_delete - _count_proteins_to_delete(user, passwd, db, owner, table)
+
+
+def _get_loader_specs(cur, tables):
+    """Returns the SQL*Loader specifications of tables that can be dumped and reloaded without deleted proteins.
+
+    :param cur: cursor.
+    :param tables: list of (owner, table).
+    :return: dictionary of table name -> (index of the PROTEIN_AC column, [(column, SQL*Loader type), ...]).
+    :rtype: dict
+    """
+    specs = {}
+    for owner, table in tables:
+        try:
+            columns = utils.get_loader_columns(cur, owner, table)
+        except ValueError as e:
+            logging.warning('{}: table cannot be reloaded'.format(e))
+            continue
+
+        names = [col_name for col_name, col_type in columns]
+        if 'PROTEIN_AC' in names:
+            specs[table] = (names.index('PROTEIN_AC'), columns)
+        else:
+            logging.warning('{}.{}: no PROTEIN_AC column: table cannot be reloaded'.format(owner, table))
+
+    return specs
+
+
+def _probe_proteins_to_delete(user, passwd, db, tables):
+    """Returns the names of the tables still containing deleted proteins.
+
+    Stops at the first matching row of each table instead of counting rows.
+    Tables are probed through their PROTEIN_AC index if they have one; otherwise the optimizer picks the join.
+    """
+    found = []
+    with utils.connect(user, passwd, db) as con:
+        cur = con.cursor()
+        for owner, table in tables:
+            cur.execute("SELECT COUNT(*) "
+                        "FROM ALL_IND_COLUMNS "
+                        "WHERE TABLE_OWNER = :1 "
+                        "AND TABLE_NAME = :2 "
+                        "AND COLUMN_NAME = 'PROTEIN_AC' "
+                        "AND COLUMN_POSITION = 1", (owner, table))
+            hint = '/*+ LEADING(S) USE_NL(T) */ ' if cur.fetchone()[0] else ''
+
+            cur.execute('SELECT COUNT(*) '
+                        'FROM DUAL '
+                        'WHERE EXISTS ('
+                        '  SELECT {}1 '
+                        '  FROM INTERPRO.DELETE_PROTEIN_STG S '
+                        '  INNER JOIN {}.{} T ON T.PROTEIN_AC = S.OLD_PROTEIN_AC'
+                        ')'.format(hint, owner, table))
+            if cur.fetchone()[0]:
+                found.append(table)
+
+    return found
+
+
 def _count_proteins_to_delete(user, passwd, db, owner, table):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         cur = con.cursor()
         cur.execute('SELECT /*+ PARALLEL */ COUNT(*) '
                     'FROM {}.{} '
@@ -468,42 +832,166 @@ def _count_proteins_to_delete(user, passwd, db, owner, table):
 
 def _delete_iter(user, passwd, db, owner, table, n, **kwargs):
     chunksize = kwargs.get('chunksize', 100000)
+    target_secs = kwargs.get('target_secs', 60)
+    min_chunksize = kwargs.get('min_chunksize', 1000)
+    max_chunksize = kwargs.get('max_chunksize', 1000000)
     logfile = kwargs.get('logfile')
+    progress = kwargs.get('progress')
+    progress_key = kwargs.get('progress_key')
     if not logfile:
         logfile = os.devnull
-    elif os.path.isfile(logfile):
-        logfile += "2"
 
+    first_id = kwargs.get('first_id', 1)  # IDs in DELETE_PROTEIN_STG start at 1
+
+    # n is the last ID to delete
+    start = max(_read_progress(progress, progress_key), first_id) if progress else first_id
     cnt_deleted = 0
+    ts = time.time()
 
-    with cx_Oracle.connect(user, passwd, db) as con, open(logfile, 'wt') as fh:
+    with utils.connect(user, passwd, db) as con, open(logfile, 'at') as fh:
         con.autocommit = 0
         cur = con.cursor()
 
-        i = 0
-        for i in range(0, n, chunksize):
-            fh.write('{:%Y-%m-%d %H:%M:%S}\t{}.{}\t{}/{}\n'.format(datetime.datetime.now(), owner, table, i, n))
+        if start > first_id:
+            fh.write('{:%Y-%m-%d %H:%M:%S}\t{}.{}\tresuming from ID {}\n'.format(
+                datetime.datetime.now(), owner, table, start
+            ))
 
+        i = start
+        while i <= n:
+            t = time.time()
             cur.execute('DELETE FROM {}.{} WHERE PROTEIN_AC IN ('
                         '  SELECT OLD_PROTEIN_AC '
                         '  FROM INTERPRO.DELETE_PROTEIN_STG '
                         '  WHERE ID >= :1 AND ID < :2'
-                        ')'.format(owner, table), (i, i + chunksize))
-            cnt_deleted += cur.rowcount
+                        ')'.format(owner, table), (i, min(i + chunksize, n + 1)))
+            cnt = cur.rowcount
             con.commit()
+            secs = time.time() - t
+
+            cnt_deleted += cnt
+            i += chunksize
+            if progress:
+                _write_progress(progress, progress_key, i)
+
+            fh.write('{:%Y-%m-%d %H:%M:%S}\t{}.{}\t{}/{}\t{} rows\t{:.0f} rows/s\tchunk: {}\n'.format(
+                datetime.datetime.now(), owner, table, min(i - 1, n), n, cnt, cnt / secs if secs else 0, chunksize
+            ))
+            fh.flush()
 
-        fh.write('{:%Y-%m-%d %H:%M:%S}\t{}.{}\tdone\n'.format(datetime.datetime.now(), owner, table))
+            # Grow or shrink chunks to get closer to the target duration (at most by a factor of 2)
+            if secs:
+                factor = min(max(target_secs / secs, 0.5), 2)
+                chunksize = int(min(max(chunksize * factor, min_chunksize), max_chunksize))
+
+        secs = time.time() - ts
+        fh.write('{:%Y-%m-%d %H:%M:%S}\t{}.{}\tdone\t{} rows\t{:.0f} rows/s\n'.format(
+            datetime.datetime.now(), owner, table, cnt_deleted, cnt_deleted / secs if secs else 0
+        ))
 
     return cnt_deleted
 
 
+def _share_workers(counts, max_workers):
+    """Distributes workers between tables in proportion to the number of rows to delete.
+
+    Each table gets one worker, then the other workers are shared by largest remainder,
+    so the total does not exceed *max_workers* (unless there are more tables than workers).
+    """
+    workers = {table: 1 for table in counts}
+    spare = max_workers - len(workers)
+    total = sum(counts.values())
+    if spare <= 0 or not total:
+        return workers
+
+    shares = {table: spare * cnt / total for table, cnt in counts.items()}
+    for table, share in shares.items():
+        workers[table] += int(share)
+
+    left = spare - sum(int(share) for share in shares.values())
+    for table in sorted(shares, key=lambda t: shares[t] - int(shares[t]), reverse=True)[:left]:
+        workers[table] += 1
+
+    return workers
+
+
+def _split_ids(n, parts):
+    """Splits IDs from 1 to n in consecutive, disjoint ranges (first and last ID included)."""
+    parts = max(1, min(parts, n))
+    size, rem = divmod(n, parts)
+
+    ranges = []
+    first_id = 1
+    for k in range(parts):
+        last_id = first_id + size - 1 + (1 if k < rem else 0)
+        ranges.append((first_id, last_id))
+        first_id = last_id + 1
+
+    return ranges
+
+
+def _read_progress(pathname, key):
+    """Returns the first ID not yet deleted, as recorded by :py:func:`_write_progress`."""
+    try:
+        with open(pathname, 'rt') as fh:
+            obj = json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return 1
+
+    if obj.get('key') != key:
+        # Recorded for another content of DELETE_PROTEIN_STG
+        return 1
+
+    return obj['next_id']
+
+
+def _write_progress(pathname, key, next_id):
+    tmp = pathname + '.tmp'
+    with open(tmp, 'wt') as fh:
+        json.dump(dict(key=key, next_id=next_id), fh)
+
+    os.replace(tmp, pathname)
+
+
+def _read_ranges(pathname, key):
+    """Returns the ranges of IDs of each table, as recorded by :py:func:`_write_ranges`."""
+    try:
+        with open(pathname, 'rt') as fh:
+            obj = json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+    if obj.get('key') != key:
+        # Recorded for another content of DELETE_PROTEIN_STG
+        return {}
+
+    return {table: [tuple(r) for r in ranges] for table, ranges in obj['ranges'].items()}
+
+
+def _write_ranges(pathname, key, ranges):
+    tmp = pathname + '.tmp'
+    with open(tmp, 'wt') as fh:
+        json.dump(dict(key=key, ranges=ranges), fh)
+
+    os.replace(tmp, pathname)
+
+
 def delete_alt(user, passwd, db, **kwargs):
     workdir = kwargs.get('workdir', os.getcwd())
     queue = kwargs.get('queue')
+    stream = kwargs.get('stream', True)
+
+    # Number of slices dumped/loaded concurrently, per table (streaming mode only)
+    slices = kwargs.get('slices', dict(MATCH=8, FEATURE_MATCH=4))
+    if not stream:
+        slices = {}
+
+    # Streamed tables are not written to the local disk
+    tmp = None if stream else 100000
 
     # Disable constraints
     logging.info('disabling constraints')
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -516,11 +1004,13 @@ def delete_alt(user, passwd, db, **kwargs):
                     "SELECT OLD_PROTEIN_AC, ROWNUM ID "
                     "FROM INTERPRO.PROTEIN_CHANGES "
                     "WHERE FLAG IN ('D', 'M')")
+        cnt_to_delete_all = cur.rowcount
         con.commit()
 
+        # Written once as a sorted array: tasks load it from disk instead of unpickling a set
         cur.execute("SELECT OLD_PROTEIN_AC "
                     "FROM INTERPRO.DELETE_PROTEIN_STG")
-        deleted = frozenset([row[0] for row in cur])
+        deleted = utils.write_exclusion_file([row[0] for row in cur], os.path.join(workdir, 'deleted.npy'))
 
         # Disable constraints (child tables)
         cur.execute("SELECT OWNER, TABLE_NAME, CONSTRAINT_NAME "
@@ -544,285 +1034,44 @@ def delete_alt(user, passwd, db, **kwargs):
 
         con.commit()
 
-    logging.info('dumping tables then loading data without deleted proteins')
-    tasks = []
-
-    # EXAMPLE
-    table = 'EXAMPLE'
-    columns = [
-        ('ENTRY_AC', 'CHAR(9)'),
-        ('PROTEIN_AC', 'CHAR(15)')
-    ]
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=1),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
-
-    # MATCH
-    table = 'MATCH'
-    columns = [
-        ('PROTEIN_AC', 'CHAR(15)'),
-        ('METHOD_AC', 'CHAR(25)'),
-        ('POS_FROM', 'INTEGER EXTERNAL'),
-        ('POS_TO', 'INTEGER EXTERNAL'),
-        ('STATUS', 'CHAR(1)'),
-        ('DBCODE', 'CHAR(1)'),
-        ('EVIDENCE', 'CHAR(3)'),
-        ('SEQ_DATE', 'DATE "YYYY-MM-DD HH24:MI:SS"'),
-        ('MATCH_DATE', 'DATE "YYYY-MM-DD HH24:MI:SS"'),
-        ('TIMESTAMP', 'DATE "YYYY-MM-DD HH24:MI:SS"'),
-        ('USERSTAMP', 'CHAR(30)'),
-        ('SCORE', 'FLOAT EXTERNAL NULLIF (SCORE = "NULL")'),
-        ('MODEL_AC', 'CHAR(255)'),
-        ('FRAGMENTS', 'CHAR(400)')
-    ]
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=0),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
-
-    # MATCH_NEW
-    table = 'MATCH_NEW'
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=0),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
-
-    # FEATURE_MATCH
-    table = 'FEATURE_MATCH'
-    columns = [
-        ('PROTEIN_AC', 'CHAR(15)'),
-        ('METHOD_AC', 'CHAR(25)'),
-        ('SEQ_FEATURE', 'CHAR(60)'),
-        ('POS_FROM', 'INTEGER EXTERNAL'),
-        ('POS_TO', 'INTEGER EXTERNAL'),
-        ('DBCODE', 'CHAR(1)'),
-        ('SEQ_DATE', 'DATE "YYYY-MM-DD HH24:MI:SS"'),
-        ('MATCH_DATE', 'DATE "YYYY-MM-DD HH24:MI:SS"'),
-        ('TIMESTAMP', 'DATE "YYYY-MM-DD HH24:MI:SS"'),
-        ('USERSTAMP', 'CHAR(30)')
-    ]
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=0),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
+        # Child tables, PROTEIN, then other tables storing protein accessions
+        constrained = [(owner, table) for owner, table, constraint in tables] + [('INTERPRO', 'PROTEIN')]
+        others = [('INTERPRO', table) for table in _OTHER_TABLES if ('INTERPRO', table) not in constrained]
 
-    # FEAUTE_MATCH_NEW
-    table = 'FEATURE_MATCH_NEW'
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=0),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
+        # Column specifications are read from the data dictionary
+        specs = _get_loader_specs(cur, constrained + others)
 
-    # MEROPS
-    table = 'MEROPS'
-    columns = [
-        ('CODE', 'CHAR(8)'),
-        ('PROTEIN_AC', 'CHAR(15)'),
-        ('POS_FROM', 'INTEGER EXTERNAL'),
-        ('POS_TO', 'INTEGER EXTERNAL'),
-        ('NAME', 'CHAR(120)'),
-        ('METHOD_AC', 'CHAR(10) NULLIF (METHOD_AC = "NULL")')
-    ]
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=1),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
-
-    # MV_ENTRY2PROTEIN
-    table = 'MV_ENTRY2PROTEIN'
-    columns = [
-        ('ENTRY_AC', 'CHAR(9)'),
-        ('PROTEIN_AC', 'CHAR(15)'),
-        ('MATCH_COUNT', 'INTEGER EXTERNAL')
-    ]
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=1),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
-
-    # MV_ENTRY2PROTEIN_TRUE
-    table = 'MV_ENTRY2PROTEIN_TRUE'
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=1),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
-
-    # MV_METHOD2PROTEIN
-    table = 'MV_METHOD2PROTEIN'
-    columns = [
-        ('METHOD_AC', 'CHAR(25)'),
-        ('PROTEIN_AC', 'CHAR(15)'),
-        ('MATCH_COUNT', 'INTEGER EXTERNAL')
-    ]
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=1),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
-
-    # PROTEIN_ACCPAIR
-    table = 'PROTEIN_ACCPAIR'
-    columns = [
-        ('PROTEIN_AC', 'CHAR(15)'),
-        ('SECONDARY_AC', 'CHAR(15)'),
-        ('USERSTAMP', 'CHAR(30)'),
-        ('TIMESTAMP', 'DATE "YYYY-MM-DD HH24:MI:SS"')
-    ]
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=0),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
-
-    # PROTEIN_ACCPAIR_NEW
-    table = 'PROTEIN_ACCPAIR_NEW'
-    columns = [
-        ('PROTEIN_AC', 'CHAR(15)'),
-        ('SECONDARY_AC', 'CHAR(15)'),
-        ('TIMESTAMP', 'DATE "YYYY-MM-DD HH24:MI:SS"')
-    ]
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=0),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
-
-    # # PROTEIN_IDA
-    # table = 'PROTEIN_IDA'
-    # columns = [
-    #     ('PROTEIN_AC', 'CHAR(15)'),
-    #     ('IDA', 'CHAR(2500)')
-    # ]
-    # tasks.append(
-    #     Task(
-    #         fn=utils.dump_and_load,
-    #         args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-    #         kwargs=dict(exclude=deleted, idx=0),
-    #         lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-    #     )
-    # )
-
-    # PROTEIN
-    table = 'PROTEIN'
-    columns = [
-        ('PROTEIN_AC', 'CHAR(15)'),
-        ('NAME', 'CHAR(26)'),
-        ('DBCODE', 'CHAR(1)'),
-        ('CRC64', 'CHAR(16)'),
-        ('LEN', 'INTEGER EXTERNAL'),
-        ('TIMESTAMP', 'DATE "YYYY-MM-DD HH24:MI:SS"'),
-        ('USERSTAMP', 'CHAR(30)'),
-        ('FRAGMENT', 'CHAR(1)'),
-        ('STRUCT_FLAG', 'CHAR(1)'),
-        ('TAX_ID', 'INTEGER EXTERNAL')
-    ]
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=0),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
-
-    # SITE_MATCH
-    table = 'SITE_MATCH'
-    columns = [
-        ('PROTEIN_AC', 'CHAR(15)'),
-        ('METHOD_AC', 'CHAR(255)'),
-        ('LOC_START', 'INTEGER EXTERNAL'),
-        ('LOC_END', 'INTEGER EXTERNAL'),
-        ('DESCRIPTION', 'CHAR(255)'),
-        ('RESIDUE', 'CHAR(5)'),
-        ('RESIDUE_START', 'INTEGER EXTERNAL'),
-        ('RESIDUE_END', 'INTEGER EXTERNAL'),
-        ('NUM_SITES', 'INTEGER EXTERNAL'),
-        ('DBCODE', 'CHAR(1)')
-    ]
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=0),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
-
-    # SITE_MATCH_NEW
-    table = 'SITE_MATCH_NEW'
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=0),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
-
-    # SUPERMATCH
-    table = 'SUPERMATCH'
-    columns = [
-        ('PROTEIN_AC', 'CHAR(15)'),
-        ('ENTRY_AC', 'CHAR(15)'),
-        ('POS_FROM', 'INTEGER EXTERNAL'),
-        ('POS_TO', 'INTEGER EXTERNAL')
-    ]
-    tasks.append(
-        Task(
-            fn=utils.dump_and_load,
-            args=(user, passwd, db, 'INTERPRO', table, columns, os.path.join(workdir, table + '.dat')),
-            kwargs=dict(exclude=deleted, idx=0),
-            lsf=dict(mem=4000, tmp=100000, name=table, queue=queue)
-        )
-    )
+    logging.info('dumping tables then loading data without deleted proteins')
+    tasks = []
+    for owner, table in constrained + others:
+        if table in specs:
+            idx, columns = specs[table]
+            tasks.append(
+                Task(
+                    fn=utils.dump_and_load,
+                    args=(user, passwd, db, owner, table, columns, os.path.join(workdir, table + '.dat')),
+                    kwargs=dict(exclude=deleted, idx=idx, stream=stream, slices=slices.get(table, 1)),
+                    lsf=dict(mem=4000, tmp=tmp, cpu=slices.get(table, 1), name=table, queue=queue)
+                )
+            )
+        else:
+            # Cannot be reloaded: delete rows instead (fails if the table has no PROTEIN_AC column)
+            tasks.append(
+                Task(
+                    fn=_delete_iter,
+                    args=(user, passwd, db, owner, table, cnt_to_delete_all),
+                    lsf=dict(name=table, queue=queue),
+                    log=False
+                )
+            )
 
     batch = Batch(tasks, dir=workdir)
     if not batch.start().wait().is_done():
         logging.critical('one or more tasks failed')
         exit(1)
 
+    os.unlink(deleted)
+
     # Post-deletion count
     logging.info('post-deletion count')
     tasks = []
@@ -832,7 +1081,8 @@ def delete_alt(user, passwd, db, **kwargs):
                 fn=_count_proteins_to_delete,
                 args=(user, passwd, db, owner, table),
                 lsf=dict(name=table, queue=queue),
-                log=False
+                log=False,
+                thread=True
             )
         )
 
@@ -841,7 +1091,8 @@ def delete_alt(user, passwd, db, **kwargs):
             fn=_count_proteins_to_delete,
             args=(user, passwd, db, 'INTERPRO', 'PROTEIN'),
             lsf=dict(name='PROTEIN', queue=queue),
-            log=False
+            log=False,
+            thread=True
         )
     )
 
@@ -875,7 +1126,8 @@ def delete_alt(user, passwd, db, **kwargs):
                 fn=utils.enable_table_constraints,
                 args=(user, passwd, db, owner, table),
                 lsf=dict(name=table, queue=queue),
-                log=False
+                log=False,
+                thread=True
             )
         )
 
@@ -886,7 +1138,7 @@ def delete_alt(user, passwd, db, **kwargs):
 
 
 def update(user, passwd, db, delete_merged=False):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1031,7 +1283,7 @@ def update_db_info(user, passwd, db, cnt_swiss, cnt_trembl, rel_version, rel_dat
     if isinstance(rel_date, str):
         rel_date = datetime.datetime.strptime(rel_date, '%d-%b-%Y')
 
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1073,7 +1325,7 @@ def update_db_info(user, passwd, db, cnt_swiss, cnt_trembl, rel_version, rel_dat
 
 
 def check_crc64(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -1,15 +1,29 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import datetime
+import itertools
+import json
 import logging
+import math
 import os
+import re
 import smtplib
 import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
 from email.message import EmailMessage
 from subprocess import Popen, PIPE
 
 import cx_Oracle
+import numpy as np
+from mundone import Batch, Task, TRACE_VAR
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
 
 
 logging.basicConfig(
@@ -18,6 +32,38 @@ logging.basicConfig(
     datefmt='%y-%m-%d %H:%M:%S'
 )
 
+# Session pools, one per process and per user/database
+_POOLS = {}
+
+# Default maximum number of sessions per pool, and number of statements cached per session.
+# Overridden by IPU_POOL_SIZE and IPU_STMT_CACHE_SIZE, read when pools and sessions are used,
+# so that tasks (in threads, or on LSF) get the values set by ipucli.py after importing this module
+POOL_SIZE = 4
+STMT_CACHE_SIZE = 40
+
+# Number of characters of a statement (whitespaces collapsed) used to tag it in traces
+SQL_TAG_LENGTH = 80
+
+_TRACE_LOCK = threading.Lock()
+
+# Session statistics captured around each statement: 'oracle' (V$MYSTAT/V$SESS_TIME_MODEL),
+# 'synthetic' (stand-in values, to test the instrumentation without access to these views), or '' (disabled)
+SESSION_STATS_VAR = 'IPU_SESSION_STATS'
+
+# Statistic name -> key in traces
+_MYSTAT_NAMES = {
+    'session logical reads': 'logical_reads',
+    'physical reads': 'physical_reads',
+    'redo size': 'redo_size'
+}
+_TIME_MODEL_NAMES = {
+    'DB CPU': 'db_cpu',
+    'DB time': 'db_time'
+}
+
+_SYNTHETIC_COUNTER = itertools.count(1)
+_session_stats_warned = False
+
 
 def sendmail(server, subject, content, from_addr, to_addrs):
     msg = EmailMessage()
@@ -35,14 +81,327 @@ def sendmail(server, subject, content, from_addr, to_addrs):
         s.send_message(msg)
 
 
+def get_pool(user, passwd, db):
+    key = (os.getpid(), user, db)
+
+    try:
+        pool = _POOLS[key]
+    except KeyError:
+        # Pools are not inherited by child processes: the PID is part of the key
+        pool = _POOLS[key] = cx_Oracle.SessionPool(
+            user, passwd, db, 1, max(int(os.environ.get('IPU_POOL_SIZE', POOL_SIZE)), 1), 1,
+            threaded=True, getmode=cx_Oracle.SPOOL_ATTRVAL_WAIT
+        )
+
+    return pool
+
+
+def get_session_stats(cursor):
+    """Returns the statistics of the current session (reads, redo size, and DB CPU/time in seconds).
+
+    Requires SELECT privileges on V$MYSTAT, V$STATNAME, and V$SESS_TIME_MODEL.
+
+    :param cursor: cursor of the session.
+    :rtype: dict
+    """
+    cursor.execute(
+        """
+        SELECT N.NAME, S.VALUE
+        FROM V$MYSTAT S
+        INNER JOIN V$STATNAME N ON S.STATISTIC# = N.STATISTIC#
+        WHERE N.NAME IN ({})
+        UNION ALL
+        SELECT STAT_NAME, VALUE / 1000000
+        FROM V$SESS_TIME_MODEL
+        WHERE SID = SYS_CONTEXT('USERENV', 'SID')
+        AND STAT_NAME IN ({})
+        """.format(
+            ', '.join("'{}'".format(name) for name in _MYSTAT_NAMES),
+            ', '.join("'{}'".format(name) for name in _TIME_MODEL_NAMES)
+        )
+    )
+
+    names = dict(_MYSTAT_NAMES, **_TIME_MODEL_NAMES)
+    return {names[name]: value for name, value in cursor}
+
+
+def get_synthetic_session_stats(cursor=None):
+    """Stand-in for :py:func:`get_session_stats`: increasing values that do not require a database.
+
+    DB CPU is the CPU time of the current process, and DB time the time elapsed since an arbitrary point.
+
+    :param cursor: ignored.
+    :rtype: dict
+    """
+    n = next(_SYNTHETIC_COUNTER)
+    return dict(
+        logical_reads=n * 100,
+        physical_reads=n * 10,
+        redo_size=n * 1000,
+        db_cpu=time.process_time(),
+        db_time=time.perf_counter()
+    )
+
+
+def _trace_statement(tag, elapsed, rows, round_trips, **stats):
+    filepath = os.environ.get(TRACE_VAR)
+    if not filepath:
+        return  # not run by mundone
+
+    line = json.dumps(dict(tag=tag, elapsed=elapsed, rows=rows, round_trips=round_trips, **stats)) + '\n'
+    with _TRACE_LOCK:
+        try:
+            with open(filepath, 'at') as fh:
+                fh.write(line)
+        except OSError:
+            pass
+
+
+class TimedCursor(object):
+    """Cursor timing the statements it executes.
+
+    A statement is timed from its execution to its last fetch (the time spent by the caller between fetches
+    is not included), and traced when the next statement is executed, or when the cursor/connection is closed.
+    The number of round-trips is estimated from the number of rows fetched and the cursor's arraysize.
+
+    If the connection captures session statistics, their deltas between the execution and the end of the statement
+    are traced too. These are session-wide values: they include the work of other cursors of the same session
+    executed in the meantime.
+    """
+
+    def __init__(self, cursor, con=None, session=None):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_con', con)
+        object.__setattr__(self, '_session', session)
+        object.__setattr__(self, '_stats', None)
+        object.__setattr__(self, '_tag', None)
+        object.__setattr__(self, '_elapsed', 0)
+        object.__setattr__(self, '_fetched', 0)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # e.g. arraysize, outputtypehandler
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        ts = time.perf_counter()
+        try:
+            row = next(self._cursor)
+        finally:
+            object.__setattr__(self, '_elapsed', self._elapsed + time.perf_counter() - ts)
+
+        object.__setattr__(self, '_fetched', self._fetched + 1)
+        return row
+
+    def _timed(self, method, tag, *args, **kwargs):
+        self.flush()
+        if self._con is not None:
+            object.__setattr__(self, '_stats', self._con.get_session_stats())
+
+        ts = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            object.__setattr__(self, '_tag', tag)
+            object.__setattr__(self, '_elapsed', time.perf_counter() - ts)
+            object.__setattr__(self, '_fetched', 0)
+
+        return self if result is self._cursor else result
+
+    def _fetch(self, method, *args):
+        ts = time.perf_counter()
+        try:
+            rows = method(*args)
+        finally:
+            object.__setattr__(self, '_elapsed', self._elapsed + time.perf_counter() - ts)
+
+        if isinstance(rows, list):
+            object.__setattr__(self, '_fetched', self._fetched + len(rows))
+        elif rows is not None:
+            object.__setattr__(self, '_fetched', self._fetched + 1)
+
+        return rows
+
+    def execute(self, statement, *args, **kwargs):
+        # statement is None when re-executing the prepared statement
+        tag = ' '.join(statement.split())[:SQL_TAG_LENGTH] if statement is not None else self._tag
+        if self._session is not None and tag and tag.upper().startswith('ALTER SESSION'):
+            self._session.set_altered()
+
+        return self._timed(self._cursor.execute, tag, statement, *args, **kwargs)
+
+    def executemany(self, statement, *args, **kwargs):
+        tag = ' '.join(statement.split())[:SQL_TAG_LENGTH] if statement is not None else self._tag
+        return self._timed(self._cursor.executemany, tag, statement, *args, **kwargs)
+
+    def callproc(self, name, *args, **kwargs):
+        return self._timed(self._cursor.callproc, 'CALL ' + name, name, *args, **kwargs)
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def flush(self):
+        """Traces the last statement executed, if not done yet."""
+        if self._tag is None:
+            return
+
+        try:
+            rows = self._cursor.rowcount
+            round_trips = 1 + math.ceil(self._fetched / max(self._cursor.arraysize, 1))
+        except cx_Oracle.InterfaceError:
+            # Cursor closed
+            rows = self._fetched
+            round_trips = None
+
+        deltas = {}
+        if self._stats:
+            stats = self._con.get_session_stats()
+            if stats:
+                deltas = {k: v - self._stats[k] for k, v in stats.items() if k in self._stats}
+
+        _trace_statement(self._tag, self._elapsed, rows, round_trips, **deltas)
+        object.__setattr__(self, '_tag', None)
+        object.__setattr__(self, '_stats', None)
+
+    def close(self):
+        self.flush()
+        self._cursor.close()
+
+
+class TimedConnection(object):
+    """Connection whose cursors are instances of :py:class:`TimedCursor`.
+
+    :param con: connection.
+    :param session_stats: session statistics captured around statements ('oracle', 'synthetic', or ``None``).
+    """
+
+    def __init__(self, con, session_stats=None):
+        object.__setattr__(self, '_con', con)
+        object.__setattr__(self, '_cursors', [])
+        object.__setattr__(self, '_stats_cursor', None)
+        object.__setattr__(self, 'altered', False)
+
+        if session_stats == 'oracle':
+            object.__setattr__(self, '_get_stats', get_session_stats)
+        elif session_stats == 'synthetic':
+            object.__setattr__(self, '_get_stats', get_synthetic_session_stats)
+        else:
+            object.__setattr__(self, '_get_stats', None)
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+    def __setattr__(self, name, value):
+        # e.g. autocommit
+        setattr(self._con, name, value)
+
+    def cursor(self, *args, **kwargs):
+        cur = TimedCursor(self._con.cursor(*args, **kwargs), self if self._get_stats else None, self)
+        self._cursors.append(cur)
+        return cur
+
+    def set_altered(self):
+        """Flags the session as altered (ALTER SESSION): it must not be reused by other callers."""
+        object.__setattr__(self, 'altered', True)
+
+    def get_session_stats(self):
+        """Returns the statistics of the session, or ``None`` if they cannot be captured."""
+        if self._get_stats is None:
+            return None
+        elif self._stats_cursor is None:
+            # Not a TimedCursor: queries on dynamic performance views are not traced
+            object.__setattr__(self, '_stats_cursor', self._con.cursor())
+
+        try:
+            return self._get_stats(self._stats_cursor)
+        except cx_Oracle.DatabaseError as exc:
+            # e.g. ORA-00942 (table or view does not exist) if not granted access to V$ views
+            global _session_stats_warned
+            if not _session_stats_warned:
+                logging.warning('cannot capture session statistics: {}'.format(exc))
+                _session_stats_warned = True
+
+            object.__setattr__(self, '_get_stats', None)
+            return None
+
+    def flush(self):
+        """Traces the last statement of each cursor."""
+        for cur in self._cursors:
+            cur.flush()
+
+        self._cursors.clear()
+
+        if self._stats_cursor is not None:
+            self._stats_cursor.close()
+            object.__setattr__(self, '_stats_cursor', None)
+
+
+@contextmanager
+def connect(user, passwd, db):
+    """Acquires a session from the process's pool.
+
+    Like ``cx_Oracle.connect()`` used as a context manager, the transaction is committed on success,
+    and rolled back on error. The session is then released to the pool instead of being closed,
+    unless it was altered with ALTER SESSION (it is then dropped from the pool).
+    Statements are timed (see :py:class:`TimedCursor`), and session statistics captured
+    if the IPU_SESSION_STATS environment variable is set.
+    """
+    pool = get_pool(user, passwd, db)
+    con = pool.acquire()
+    con.stmtcachesize = int(os.environ.get('IPU_STMT_CACHE_SIZE', STMT_CACHE_SIZE))
+    timed_con = TimedConnection(con, os.environ.get(SESSION_STATS_VAR))
+
+    try:
+        yield timed_con
+    except BaseException:
+        timed_con.flush()
+        try:
+            con.rollback()
+        except cx_Oracle.DatabaseError:
+            # Session unusable: do not return it to the pool
+            pool.drop(con)
+        else:
+            _release(pool, con, timed_con.altered)
+        raise
+    else:
+        timed_con.flush()
+        con.commit()
+        _release(pool, con, timed_con.altered)
+
+
+def _release(pool, con, altered):
+    if altered:
+        # Settings changed with ALTER SESSION (e.g. FORCE PARALLEL DML) would leak into later users of the session
+        pool.drop(con)
+    else:
+        pool.release(con)
+
+
+def close_pools():
+    for key in list(_POOLS):
+        if key[0] == os.getpid():
+            _POOLS.pop(key).close()
+
+
 def test_con(user, password, host):
     success = False
     try:
-        con = cx_Oracle.connect(user, password, host)
+        with connect(user, password, host):
+            pass
     except cx_Oracle.DatabaseError:
         pass
     else:
-        con.close()
         success = True
     finally:
         return success
@@ -50,16 +409,18 @@ def test_con(user, password, host):
 
 def toggle_constraint(cursor, owner, table, name, enable=True, credentials=()):
     if cursor is None:
-        con = cx_Oracle.connect(*credentials)
-        con.autocommit = 0
-        cur = con.cursor()
-    else:
-        cur = cursor
+        with connect(*credentials) as con:
+            con.autocommit = 0
+            cur = con.cursor()
+            success = toggle_constraint(cur, owner, table, name, enable=enable)
+            cur.close()
+
+        return success
 
     stmt = 'ALTER TABLE {}.{} {} CONSTRAINT {}'.format(owner, table, 'ENABLE' if enable else 'DISABLE', name)
 
     try:
-        cur.execute(stmt)
+        cursor.execute(stmt)
     except cx_Oracle.DatabaseError:
         success = False
     else:
@@ -69,11 +430,6 @@ def toggle_constraint(cursor, owner, table, name, enable=True, credentials=()):
         'enabled' if enable else 'disabled', name, owner, table, 'done' if success else 'failed'
     ))
 
-    if cursor is None:
-        cur.close()
-        con.commit()
-        con.close()
-
     return success
 
 
@@ -86,9 +442,57 @@ def get_constraints(cursor, owner, table):
     return [dict(zip(['name', 'status'], row)) for row in cursor]
 
 
+def get_loader_columns(cursor, owner, table):
+    """Returns the SQL*Loader specifications of the columns of a table, in the order of the table.
+
+    Specifications match the output of :py:func:`dump_table` ('NULL' for null values, dates as 'YYYY-MM-DD HH24:MI:SS',
+    timestamps with nine digits of fractional seconds).
+
+    :param cursor: cursor.
+    :param owner: owner of the table.
+    :param table: name of the table.
+    :return: list of (column name, SQL*Loader type).
+    :rtype: list
+    :raises ValueError: if the table does not exist, or has a column that cannot be dumped as text.
+    """
+    cursor.execute("SELECT COLUMN_NAME, DATA_TYPE, DATA_LENGTH, DATA_SCALE, NULLABLE "
+                   "FROM ALL_TAB_COLUMNS "
+                   "WHERE OWNER = :1 "
+                   "AND TABLE_NAME = :2 "
+                   "ORDER BY COLUMN_ID", (owner.upper(), table.upper()))
+
+    columns = []
+    for name, data_type, length, scale, nullable in cursor.fetchall():
+        nullable = nullable == 'Y'
+
+        if data_type in ('CHAR', 'NCHAR', 'VARCHAR2', 'NVARCHAR2'):
+            # Null values are written as 'NULL': the field must be large enough
+            col_type = 'CHAR({})'.format(max(length, 4) if nullable else length)
+        elif data_type == 'NUMBER' and scale == 0:
+            col_type = 'INTEGER EXTERNAL'
+        elif data_type in ('NUMBER', 'FLOAT', 'BINARY_FLOAT', 'BINARY_DOUBLE'):
+            col_type = 'FLOAT EXTERNAL'
+        elif data_type == 'DATE':
+            col_type = 'DATE "YYYY-MM-DD HH24:MI:SS"'
+        elif re.match(r'TIMESTAMP\(\d\)$', data_type):
+            col_type = 'TIMESTAMP "YYYY-MM-DD HH24:MI:SS.FF"'
+        else:
+            raise ValueError('{}.{}: unsupported type {} for column {}'.format(owner, table, data_type, name))
+
+        if nullable:
+            col_type += ' NULLIF ({} = "NULL")'.format(name)
+
+        columns.append((name, col_type))
+
+    if not columns:
+        raise ValueError('{}.{}: table not found'.format(owner, table))
+
+    return columns
+
+
 def enable_table_constraints(user, passwd, db, owner, table):
     success = True
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
         constraints = get_constraints(cur, owner, table)
@@ -104,47 +508,133 @@ def dump_table(user, passwd, db, owner, table, columns, pathname, **kwargs):
     idx = kwargs.get('idx', 0)
     buffersize = kwargs.get('buffersize', 1000000)
     separator = kwargs.get('separator', '|')
+    compress = kwargs.get('compress', False)
+    where = kwargs.get('where')
+    scn = kwargs.get('scn')
+    arraysize = kwargs.get('arraysize', 10000)
 
-    fmt = separator.join(['{}' for _ in range(len(columns))]) + '\n'
+    if compress:
+        fh = lz4.frame.open(pathname, 'wb')
+    else:
+        fh = open(pathname, 'wb')
 
-    with cx_Oracle.connect(user, passwd, db) as con, open(pathname, 'wt') as fh:
-        data = []
+    with connect(user, passwd, db) as con, fh:
         cur = con.cursor()
 
-        cur.execute('SELECT {} FROM {}.{}'.format(', '.join(columns), owner, table))
-        cnt1 = 0
-        cnt2 = 0
-        for row in cur:
-            cnt1 += 1
-            if row[idx] in exclude:
+        # Dates are converted to strings by Oracle, without changing the settings of the (pooled) session
+        cur.execute('SELECT {} FROM {}.{} WHERE 1 = 0'.format(', '.join(columns), owner, table))
+        exprs = [_as_string(col, desc[1]) for col, desc in zip(columns, cur.description)]
+        cur.arraysize = arraysize
+
+        sql = 'SELECT {} FROM {}.{}'.format(', '.join(exprs), owner, table)
+        if scn:
+            sql += ' AS OF SCN {}'.format(scn)
+
+        # Several conditions are queried one after the other
+        cnt1 = cnt2 = 0
+        for cond in (where if isinstance(where, (list, tuple)) else [where]):
+            cur.execute(sql + ' WHERE ' + cond if cond else sql)
+            n1, n2 = write_rows(cur, fh, exclude=exclude, idx=idx, buffersize=buffersize, separator=separator)
+            cnt1 += n1
+            cnt2 += n2
+
+    return cnt1, cnt2
+
+
+def _as_string(column, type_code):
+    """Returns the expression selecting a column, formatted as expected by :py:func:`get_loader_columns` for dates."""
+    if type_code == cx_Oracle.TIMESTAMP:
+        return "TO_CHAR({0}, 'YYYY-MM-DD HH24:MI:SS.FF9') {0}".format(column)
+    elif type_code == cx_Oracle.DATETIME:
+        return "TO_CHAR({0}, 'YYYY-MM-DD HH24:MI:SS') {0}".format(column)
+
+    return column
+
+
+def write_rows(cursor, fh, **kwargs):
+    """Writes the rows of an executed cursor as separated values, processing rows one batch and one column at a time.
+
+    :param cursor: cursor on which a query has been executed (only ``description`` and ``fetchmany()`` are used).
+    :param fh: file object opened in binary mode.
+    :param kwargs: keyword arguments (*exclude*, *idx*, *buffersize*, *separator*).
+    :return: number of rows read, and number of rows written.
+    :rtype: tuple
+    """
+    exclude = kwargs.get('exclude', [])
+    idx = kwargs.get('idx', 0)
+    buffersize = kwargs.get('buffersize', 1000000)
+    separator = kwargs.get('separator', '|')
+
+    if isinstance(exclude, str):
+        # Path to a file created by write_exclusion_file()
+        exclude = np.load(exclude, mmap_mode='r')
+
+    # Columns already fetched as strings do not have to be converted
+    str_types = (cx_Oracle.STRING, cx_Oracle.FIXED_CHAR)
+    is_str = [col[1] in str_types for col in cursor.description]
+
+    cnt1 = 0
+    cnt2 = 0
+    milestone = buffersize
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            break
+
+        cnt1 += len(rows)
+        if isinstance(exclude, np.ndarray):
+            mask = isin_sorted(np.array([row[idx] for row in rows], dtype=exclude.dtype), exclude)
+            if mask.any():
+                rows = [row for row, excluded in zip(rows, mask.tolist()) if not excluded]
+                if not rows:
+                    continue
+        elif exclude:
+            rows = [row for row in rows if row[idx] not in exclude]
+            if not rows:
                 continue
-            cnt2 += 1
-
-            # Convert datetime columns to string "YYYY-MM-HH HH:MM:SS" format
-            _row = []
-
-            for col in row:
-                if isinstance(col, datetime.datetime):
-                    _row.append(col.strftime('%Y-%m-%d %H:%M:%S'))
-                elif col is None:
-                    _row.append('NULL')
-                else:
-                    _row.append(col)
-            data.append(_row)
-
-            if not cnt2 % buffersize:
-                fh.write(''.join([fmt.format(*row) for row in data]))
-                data = []
-                logging.info('{} entries dumped'.format(cnt2))
-
-        if data:
-            fh.write(''.join([fmt.format(*row) for row in data]))
+
+        cnt2 += len(rows)
+
+        columns = []
+        for values, col_is_str in zip(zip(*rows), is_str):
+            if col_is_str:
+                columns.append(['NULL' if v is None else v for v in values])
+            else:
+                columns.append(['NULL' if v is None else str(v) for v in values])
+
+        fh.write(('\n'.join(map(separator.join, zip(*columns))) + '\n').encode())
+
+        if cnt2 >= milestone:
             logging.info('{} entries dumped'.format(cnt2))
+            milestone += buffersize
 
+    logging.info('{} entries dumped'.format(cnt2))
     return cnt1, cnt2
 
 
-def sqlldr(user, passwd, db, owner, table, columns, data_file, separator='|', nrows=None):
+def write_exclusion_file(accessions, pathname):
+    """Writes accessions as a sorted, fixed-width array, to be passed as *exclude* to :py:func:`dump_and_load`.
+
+    :param accessions: list of accessions.
+    :param pathname: path of the output file (.npy).
+    :return: the path of the output file.
+    :rtype: str
+    """
+    np.save(pathname, np.unique(np.array(accessions, dtype='S15')))
+    return pathname
+
+
+def isin_sorted(a, b):
+    """Returns a boolean mask of the elements of *a* that are in *b*, which must be sorted."""
+    if not b.size:
+        return np.zeros(a.size, dtype=bool)
+
+    idx = np.searchsorted(b, a)
+    idx[idx == b.size] = 0
+    return b[idx] == a
+
+
+def sqlldr(user, passwd, db, owner, table, columns, data_file, separator='|', nrows=None, parallel=False):
     lines = [
         "LOAD DATA",
         "APPEND",
@@ -185,6 +675,10 @@ def sqlldr(user, passwd, db, owner, table, columns, data_file, separator='|', nr
     if nrows:
         args.append('ROWS={}'.format(nrows))
 
+    if parallel:
+        # Allows several direct-path sessions to load the same table concurrently
+        args.append('PARALLEL=TRUE')
+
     # logging.info('\t' + ' '.join(args))
 
     p1 = Popen(['echo', passwd], stdout=PIPE)
@@ -211,27 +705,48 @@ def dump_and_load(user, passwd, db, owner, table, columns, pathname, **kwargs):
     idx = kwargs.get('idx', 0)
     buffersize = kwargs.get('buffersize', 1000000)
     separator = kwargs.get('separator', '|')
+    stream = kwargs.get('stream', False)
+    compress = kwargs.get('compress', False)
+    slices = kwargs.get('slices', 1)
 
     # columns: [(name, type), ...]
 
+    if stream:
+        return _stream_and_load(user, passwd, db, owner, table, columns,
+                                exclude=exclude, idx=idx, buffersize=buffersize, separator=separator,
+                                slices=slices, workdir=os.path.dirname(pathname))
+
+    if compress and lz4 is None:
+        logging.warning('lz4 is not installed: data will not be compressed')
+        compress = False
+    elif compress:
+        pathname += '.lz4'
+
     logging.info('dumping data from {}.{} to {}'.format(owner, table, pathname))
     n1, n2 = dump_table(
         user, passwd, db,
         owner, table, [col_name for col_name, col_type in columns],
         pathname,
-        exclude=exclude, idx=idx, buffezsize=buffersize, separator=separator
+        exclude=exclude, idx=idx, buffersize=buffersize, separator=separator, compress=compress
     )
 
     logging.info('{} entries out of {} dumped'.format(n2, n1))
 
     logging.info('truncating {}.{}'.format(owner, table))
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
         cur.execute('TRUNCATE TABLE {}.{}'.format(owner, table))
         con.commit()
 
-    if n2:
+    if n2 and compress:
+        logging.info('loading data to {}.{}'.format(owner, table))
+        _, (err, log, bad, discard) = _load_through_fifo(
+            user, passwd, db, owner, table, columns,
+            lambda fifo: _decompress(pathname, fifo),
+            separator=separator
+        )
+    elif n2:
         logging.info('loading data to {}.{}'.format(owner, table))
         err, log, bad, discard = sqlldr(user, passwd, db, owner, table, columns, pathname, separator=separator)
     else:
@@ -250,8 +765,363 @@ def dump_and_load(user, passwd, db, owner, table, columns, pathname, **kwargs):
     return err, log, bad, discard
 
 
+def _stream_and_load(user, passwd, db, owner, table, columns, **kwargs):
+    """Dumps a table into a named pipe read at the same time by SQL*Loader.
+
+    As the table cannot be read and loaded at the same time, rows are loaded into a staging table.
+    The table is truncated only once the staging table contains all the rows that were dumped
+    (see :py:func:`mark_staging_complete`), then rows are copied back with a direct-path insert.
+    If a previous run was interrupted after that point, rows are copied back from its staging table instead.
+
+    If *slices* is greater than 1, the table is split in ROWID ranges (see :py:func:`get_rowid_ranges`),
+    each dumped and loaded by its own process. All slices are read as of the same SCN.
+    """
+    slices = max(kwargs.get('slices', 1), 1)
+    workdir = kwargs.get('workdir')
+    staging = get_staging_name(table)
+    dump_kwargs = dict(
+        exclude=kwargs.get('exclude', []),
+        idx=kwargs.get('idx', 0),
+        buffersize=kwargs.get('buffersize', 1000000),
+        separator=kwargs.get('separator', '|')
+    )
+
+    with connect(user, passwd, db) as con:
+        con.autocommit = 0
+        if resume_staging(con, owner, table, staging):
+            return '', '', '', ''
+
+        create_staging(con, owner, table, staging)
+
+        if slices > 1:
+            cur = con.cursor()
+            scn = cur.callfunc('DBMS_FLASHBACK.GET_SYSTEM_CHANGE_NUMBER', int)
+
+            # Ranges computed after the SCN: they cover every row visible as of the SCN
+            ranges = get_rowid_ranges(cur, owner, table, slices)
+            cur.close()
+            slices = max(len(ranges), 1)
+
+    logging.info('streaming data from {}.{} to {}.{} ({} slice(s))'.format(owner, table, owner, staging, slices))
+    if slices > 1:
+        tasks = []
+        for i, slice_ranges in enumerate(ranges):
+            tasks.append(
+                Task(
+                    fn=_stream_slice,
+                    args=(user, passwd, db, owner, table, staging, columns),
+                    kwargs=dict(dump_kwargs, ranges=slice_ranges, scn=scn),
+                    name='{}_{}'.format(table, i)
+                )
+            )
+
+        batch = Batch(tasks, dir=workdir)
+        if not batch.start().wait(secs=10).is_done():
+            logging.critical('one or more slices failed: {}.{} left unchanged'.format(owner, table))
+            exit(1)
+
+        results = batch.results
+    else:
+        results = [_stream_slice(user, passwd, db, owner, table, staging, columns, **dump_kwargs)]
+
+    # Reconcile row counts of each slice
+    n1 = n2 = 0
+    outputs = []
+    for i, (cnt_read, cnt_dumped, cnt_loaded, output) in enumerate(results):
+        logging.info('slice {}: {} entries read, {} dumped, {} loaded'.format(i, cnt_read, cnt_dumped, cnt_loaded))
+
+        if cnt_loaded != cnt_dumped:
+            for text in output:
+                logging.info(text)
+
+            logging.critical('slice {}: {} entries dumped but {} loaded: {}.{} left unchanged'.format(
+                i, cnt_dumped, cnt_loaded, owner, table
+            ))
+            exit(1)
+
+        n1 += cnt_read
+        n2 += cnt_dumped
+        outputs.append(output)
+
+    logging.info('{} entries out of {} dumped'.format(n2, n1))
+
+    err, log, bad, discard = [
+        '\n'.join(t.decode() if isinstance(t, bytes) else t for t in texts)
+        for texts in zip(*outputs)
+    ]
+    logging.info(err)
+    logging.info(log)
+    logging.info(bad)
+    logging.info(discard)
+
+    with connect(user, passwd, db) as con:
+        con.autocommit = 0
+        cur = con.cursor()
+
+        if slices > 1:
+            # Make sure that slices covered the whole table (as of the SCN at which they were read)
+            cur.execute('SELECT COUNT(*) FROM {}.{} AS OF SCN {}'.format(owner, table, scn))
+            cnt = cur.fetchone()[0]
+
+            if cnt != n1:
+                logging.critical('{} entries read but {} in table: {}.{} left unchanged'.format(n1, cnt, owner, table))
+                exit(1)
+
+        cur.execute('SELECT COUNT(*) FROM {}.{}'.format(owner, staging))
+        n3 = cur.fetchone()[0]
+
+        if n3 != n2:
+            logging.critical('{} entries dumped but {} loaded: {}.{} left unchanged'.format(n2, n3, owner, table))
+            exit(1)
+
+        mark_staging_complete(con, owner, staging)
+        reload_from_staging(con, owner, table, staging)
+
+    return err, log, bad, discard
+
+
+# Comment set on staging tables holding all the rows to copy back (see mark_staging_complete)
+_STAGING_COMPLETE = 'complete'
+
+# Maximum length of Oracle identifiers (before 12.2)
+_MAX_NAME_LENGTH = 30
+
+
+def get_staging_name(table):
+    """Returns the name of the staging table of a table, within the length limit of Oracle identifiers.
+
+    The name only depends on *table*, so an interrupted run finds the staging table it left.
+    """
+    name = '{}_DLSTG'.format(table)
+    if len(name) > _MAX_NAME_LENGTH:
+        # Truncated name, made unique by a checksum of the full name
+        name = '{}_{:08X}_DLSTG'.format(table[:_MAX_NAME_LENGTH - 15], zlib.crc32(table.encode()))
+
+    return name
+
+
+def create_staging(con, owner, table, staging, where=None):
+    """Creates a staging table with the structure of *table*.
+
+    If *where* is ``None``, the staging table is empty; otherwise it contains the rows of *table* matching *where*.
+    An incomplete staging table left by an interrupted run is dropped (*table* was not truncated),
+    but a complete one is never dropped, as it may hold the only copy of the rows.
+
+    :raises RuntimeError: if a complete staging table exists (see :py:func:`resume_staging`).
+    """
+    cur = con.cursor()
+
+    status = _get_staging_status(cur, owner, staging)
+    if status == _STAGING_COMPLETE:
+        cur.close()
+        raise RuntimeError('{}.{} holds the rows of {}.{}: the copy must be resumed'.format(
+            owner, staging, owner, table
+        ))
+    elif status is not None:
+        cur.execute('DROP TABLE {}.{} PURGE'.format(owner, staging))
+
+    cur.execute('CREATE TABLE {0}.{1} NOLOGGING {3}AS SELECT * FROM {0}.{2} T WHERE {4}'.format(
+        owner, staging, table, 'PARALLEL ' if where else '', where or '1 = 0'
+    ))
+    cur.close()
+
+
+def mark_staging_complete(con, owner, staging):
+    """Flags a staging table as holding all the rows to copy back. Must be called before :py:func:`reload_from_staging`.
+
+    The flag is a table comment: as a DDL statement, it is committed at once.
+    """
+    cur = con.cursor()
+    cur.execute("COMMENT ON TABLE {}.{} IS '{}'".format(owner, staging, _STAGING_COMPLETE))
+    cur.close()
+
+
+def resume_staging(con, owner, table, staging):
+    """Copies back the rows of a complete staging table left by an interrupted run.
+
+    :return: ``True`` if rows were copied back, ``False`` if there is no complete staging table.
+    :rtype: bool
+    """
+    cur = con.cursor()
+    status = _get_staging_status(cur, owner, staging)
+    cur.close()
+
+    if status != _STAGING_COMPLETE:
+        return False
+
+    logging.warning('{}.{} left by an interrupted run: resuming'.format(owner, staging))
+    reload_from_staging(con, owner, table, staging)
+    return True
+
+
+def _get_staging_status(cur, owner, staging):
+    """Returns the comment of a staging table ('' if none), or ``None`` if the table does not exist."""
+    cur.execute("SELECT COMMENTS "
+                "FROM ALL_TAB_COMMENTS "
+                "WHERE OWNER = :1 "
+                "AND TABLE_NAME = :2", (owner.upper(), staging.upper()))
+    row = cur.fetchone()
+    return (row[0] or '') if row else None
+
+
+def reload_from_staging(con, owner, table, staging):
+    """Replaces the rows of a table by those of a complete staging table, then drops the staging table.
+
+    Until the staging table is dropped, an interrupted reload can be restarted with :py:func:`resume_staging`.
+    """
+    cur = con.cursor()
+
+    logging.info('truncating {}.{}'.format(owner, table))
+    cur.execute('TRUNCATE TABLE {}.{}'.format(owner, table))
+
+    logging.info('copying data from {}.{} to {}.{}'.format(owner, staging, owner, table))
+    cur.execute('INSERT /*+ APPEND */ INTO {0}.{1} SELECT * FROM {0}.{2}'.format(owner, table, staging))
+    con.commit()
+
+    cur.execute('DROP TABLE {}.{} PURGE'.format(owner, staging))
+    cur.close()
+
+
+def get_rowid_ranges(cursor, owner, table, n):
+    """Splits a table in ROWID ranges (built from its extents by DBMS_PARALLEL_EXECUTE), grouped in at most *n* slices.
+
+    :param cursor: cursor.
+    :param owner: owner of the table.
+    :param table: name of the table.
+    :param n: number of slices.
+    :return: list of slices, each a list of (first ROWID, last ROWID).
+    :rtype: list
+    """
+    cursor.execute("SELECT BLOCKS "
+                   "FROM ALL_TABLES "
+                   "WHERE OWNER = :1 "
+                   "AND TABLE_NAME = :2", (owner.upper(), table.upper()))
+    row = cursor.fetchone()
+    blocks = row[0] if row and row[0] else 0
+
+    # About four chunks per slice, so slices have similar sizes despite extents of different sizes
+    task = 'IPU_{}_{}'.format(table, os.getpid())
+    cursor.callproc('DBMS_PARALLEL_EXECUTE.CREATE_TASK', (task,))
+    try:
+        cursor.execute("BEGIN "
+                       "  DBMS_PARALLEL_EXECUTE.CREATE_CHUNKS_BY_ROWID(:1, :2, :3, FALSE, :4); "
+                       "END;", (task, owner.upper(), table.upper(), max(blocks // (4 * n), 1)))
+        cursor.execute("SELECT ROWIDTOCHAR(START_ROWID), ROWIDTOCHAR(END_ROWID) "
+                       "FROM USER_PARALLEL_EXECUTE_CHUNKS "
+                       "WHERE TASK_NAME = :1 "
+                       "ORDER BY CHUNK_ID", (task,))
+        chunks = cursor.fetchall()
+    finally:
+        cursor.callproc('DBMS_PARALLEL_EXECUTE.DROP_TASK', (task,))
+
+    n = min(n, len(chunks))
+    return [chunks[k * len(chunks) // n:(k + 1) * len(chunks) // n] for k in range(n)]
+
+
+def _stream_slice(user, passwd, db, owner, table, staging, columns, **kwargs):
+    """Streams the rows of a table (or of some ROWID ranges) into the staging table.
+
+    :param kwargs: keyword arguments of :py:func:`dump_table`, and *ranges*, list of (first ROWID, last ROWID).
+    :return: number of rows read, dumped, loaded, and the output of :py:func:`sqlldr`.
+    :rtype: tuple
+    """
+    separator = kwargs.get('separator', '|')
+    ranges = kwargs.pop('ranges', None)
+
+    if ranges:
+        kwargs['where'] = [
+            "ROWID BETWEEN CHARTOROWID('{}') AND CHARTOROWID('{}')".format(first, last)
+            for first, last in ranges
+        ]
+
+    (n1, n2), output = _load_through_fifo(
+        user, passwd, db, owner, staging, columns,
+        lambda fifo: dump_table(
+            user, passwd, db,
+            owner, table, [col_name for col_name, col_type in columns],
+            fifo,
+            **kwargs
+        ),
+        separator=separator,
+        parallel=ranges is not None
+    )
+
+    return n1, n2, _count_loaded_rows(output[1]) if n2 else 0, output
+
+
+def _count_loaded_rows(log):
+    """Parses the number of rows successfully loaded from a SQL*Loader log."""
+    m = re.search(r'(\d+) Rows? successfully loaded', log)
+    return int(m.group(1)) if m else 0
+
+
+def _load_through_fifo(user, passwd, db, owner, table, columns, produce, separator='|', parallel=False):
+    """Runs SQL*Loader on a named pipe while *produce* writes into it.
+
+    :param produce: function called with the path of the named pipe.
+    :return: the value returned by *produce*, and the output of :py:func:`sqlldr`.
+    """
+    fifodir = tempfile.mkdtemp()
+    fifo = os.path.join(fifodir, table + '.dat')
+    os.mkfifo(fifo)
+    loaded = []
+    errors = []
+    produced = threading.Event()
+
+    def _load():
+        try:
+            loaded.append(sqlldr(user, passwd, db, owner, table, columns, fifo, separator=separator, parallel=parallel))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # If SQL*Loader exited (or failed to start) without reading the pipe, unblock the producer
+            while not produced.is_set():
+                try:
+                    os.close(os.open(fifo, os.O_RDONLY | os.O_NONBLOCK))
+                except OSError:
+                    pass
+
+                produced.wait(0.1)
+
+    t = threading.Thread(target=_load)
+    t.start()
+
+    try:
+        result = produce(fifo)
+    finally:
+        produced.set()
+        while t.is_alive():
+            # If the producer failed before opening the pipe, unblock SQL*Loader
+            try:
+                os.close(os.open(fifo, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+
+            t.join(1)
+
+        os.unlink(fifo)
+        os.rmdir(fifodir)
+
+        if not loaded:
+            raise RuntimeError('{}.{}: SQL*Loader failed: {}'.format(
+                owner, table, errors[0] if errors else 'unknown error'
+            ))
+
+    return result, loaded[0]
+
+
+def _decompress(src, dst, buffersize=1024 * 1024):
+    with lz4.frame.open(src, 'rb') as fh1, open(dst, 'wb') as fh2:
+        while True:
+            buf = fh1.read(buffersize)
+            if not buf:
+                break
+
+            fh2.write(buf)
+
+
 def refresh_materialized_view(user, passwd, db, table, method='F'):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -18,7 +18,7 @@ logging.basicConfig(
 
 
 def refresh_uniparc(user, passwd, db, useproc=True):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         cur = con.cursor()
 
         cur.execute('SELECT MAX(UPI) FROM UNIPARC.XREF')
@@ -98,7 +98,7 @@ def refresh_uniparc(user, passwd, db, useproc=True):
 
 def refresh_method2swiss(user, passwd, db):
     logging.info('refreshing METHOD2SWISS_DE')
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -119,7 +119,7 @@ def refresh_method2swiss(user, passwd, db):
 
 
 def update_splice_variants(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -197,7 +197,7 @@ def update_splice_variants(user, passwd, db):
 
 
 def update_taxonomy(user, passwd, db):
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
@@ -361,7 +361,7 @@ def dump(user, passwd, user2, passwd2, db, outdir, **kwargs):
     except FileExistsError:
         pass
 
-    with cx_Oracle.connect(user2, passwd2, db) as con:
+    with utils.connect(user2, passwd2, db) as con:
         con.autocommit = 0
         cur = con.cursor()
         cur.execute('GRANT SELECT ON IPRSCAN.MV_IPM_HAMAP_MATCH TO KRAKEN')
@@ -369,7 +369,7 @@ def dump(user, passwd, user2, passwd2, db, outdir, **kwargs):
         cur.execute('GRANT SELECT ON IPRSCAN.MV_IPM_PROSITE_PATTERNS_MATCH TO KRAKEN')
         con.commit()
 
-    with cx_Oracle.connect(user, passwd, db) as con:
+    with utils.connect(user, passwd, db) as con:
         con.autocommit = 0
         cur = con.cursor()
 
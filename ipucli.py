@@ -3,10 +3,11 @@
 
 import argparse
 import configparser
+import functools
 import logging
 import os
 
-from mundone import Task, Workflow
+from mundone import LocalPool, Task, Workflow, gantt_svg, gantt_text
 
 import ipu.iprscan
 import ipu.matches
@@ -28,6 +29,61 @@ def parse_addrs(s):
     return [addr.strip() for addr in s.split(',') if len(addr.strip())]
 
 
+def print_usage(usage):
+    print('{:<25}{:>6}{:>8}{:>12}{:>12}{:>12}{:>10}{:>10}{:>10}{:>10}'.format(
+        'task', 'runs', 'failed', 'avg time', 'max time', 'avg CPU', 'max mem', 'req mem', 'read', 'written'
+    ))
+
+    for u in usage:
+        print('{:<25}{:>6}{:>8}{:>12}{:>12}{:>12}{:>10}{:>10}{:>10}{:>10}'.format(
+            u['name'], u['runs'], u['failed'],
+            format_secs(u['avg_wall_time']), format_secs(u['max_wall_time']), format_secs(u['avg_cpu_time']),
+            '{:.0f}M'.format(u['max_mem']) if u['max_mem'] is not None else '-',
+            '{}M'.format(u['req_mem']) if u['req_mem'] is not None else '-',
+            format_bytes(u['avg_read_bytes']), format_bytes(u['avg_write_bytes'])
+        ))
+
+
+def print_statements(statements):
+    print('{:<25}{:>12}{:>12}{:>10}{:>12}{:>8}{:>12}{:>12}{:>15}{:>15}{:>10}  {}'.format(
+        'task', 'time', 'max time', 'count', 'rows', 'trips', 'DB CPU', 'DB time', 'logical reads',
+        'physical reads', 'redo', 'statement'
+    ))
+
+    for obj in statements:
+        print('{:<25}{:>12}{:>12}{:>10}{:>12}{:>8}{:>12}{:>12}{:>15}{:>15}{:>10}  {}'.format(
+            obj['name'], format_secs(obj['elapsed']), format_secs(obj['max_elapsed']), obj['executions'],
+            obj['rows'] if obj['rows'] is not None else '-',
+            obj['round_trips'] if obj['round_trips'] is not None else '-',
+            format_secs(obj['db_cpu']), format_secs(obj['db_time']),
+            obj['logical_reads'] if obj['logical_reads'] is not None else '-',
+            obj['physical_reads'] if obj['physical_reads'] is not None else '-',
+            format_bytes(obj['redo_size']), obj['tag']
+        ))
+
+
+def format_secs(secs):
+    if secs is None:
+        return '-'
+
+    m, s = divmod(int(round(secs)), 60)
+    h, m = divmod(m, 60)
+    return '{}:{:02d}:{:02d}'.format(h, m, s)
+
+
+def format_bytes(n):
+    if n is None:
+        return '-'
+
+    for unit in ('B', 'K', 'M', 'G'):
+        if n < 1024:
+            return '{:.0f}{}'.format(n, unit)
+
+        n /= 1024
+
+    return '{:.0f}T'.format(n)
+
+
 def main():
     parser = argparse.ArgumentParser(description='Perform the InterPro Protein Update')
     parser.add_argument('config', metavar='config.ini', help='configuration file')
@@ -38,8 +94,33 @@ def main():
                         help='do not wait for tasks to complete (only tasks without dependencies are run)')
     parser.add_argument('--nodep', action='store_true', default=False, help='do not include dependencies (run only the requested tasks)')
     parser.add_argument('--lowmem', action='store_true', default=False, help='optimized for low-resources databases')
+    parser.add_argument('--delete-strategy', choices=['delete', 'copy', 'reload', 'auto'], default='delete',
+                        help='how deleted proteins are removed from tables (default: delete; '
+                             'auto: cheapest predicted strategy per table)')
+    parser.add_argument('--no-count', action='store_true', default=False,
+                        help='do not count rows to delete beforehand: rely on the number of deleted rows, '
+                             'then probe tables for remaining proteins (chunked deletes only)')
+    parser.add_argument('--no-cache', action='store_true', default=False,
+                        help='run tasks even if their inputs did not change since a successful run')
+    parser.add_argument('--local', type=int, metavar='N',
+                        help='run tasks on the local host, at most N at a time, instead of submitting them to LSF')
+    parser.add_argument('--profile', nargs='+', metavar='TASK', default=[],
+                        help='run tasks under cProfile (statistics saved next to the task logs)')
+    parser.add_argument('--session-stats', choices=['oracle', 'synthetic'],
+                        help='capture session statistics around each SQL statement (oracle: from V$MYSTAT and '
+                             'V$SESS_TIME_MODEL; synthetic: stand-in values for testing)')
+    parser.add_argument('--report', choices=['usage', 'statements', 'gantt'],
+                        help='report on past runs (usage: time, CPU, memory, and I/O per task; '
+                             'statements: slowest SQL statements of the last run of each task; '
+                             'gantt: timeline of the last run of each task, or of the tasks passed with -t, '
+                             'with the critical path), then exit')
+    parser.add_argument('--svg', metavar='FILE', help='with --report gantt, also write the timeline as SVG')
     args = parser.parse_args()
 
+    if args.local is not None and args.detach:
+        logging.critical('--local and --detach cannot be combined (queued tasks would never start)')
+        exit(1)
+
     if not os.path.isfile(args.config):
         logging.critical("cannot open '{}': no such file or directory".format(args.config))
         exit(1)
@@ -62,6 +143,7 @@ def main():
     tabdir = None
 
     queue = None
+    oracle_parallel = None  # not limited, unless configured
 
     smtp_host = None
     sender = None
@@ -117,6 +199,27 @@ def main():
         )
         exit(1)
 
+    # Credentials are valid: do not keep idle sessions open in this process
+    ipu.utils.close_pools()
+
+    if args.session_stats:
+        # Inherited by tasks through the environment
+        os.environ[ipu.utils.SESSION_STATS_VAR] = args.session_stats
+
+    # Size of session pools and statement caches (inherited by tasks through the environment)
+    for option, var in (('pool_size', 'IPU_POOL_SIZE'), ('stmt_cache_size', 'IPU_STMT_CACHE_SIZE')):
+        value = config['database'].get(option, '')
+        if not value:
+            continue
+
+        try:
+            value = int(value)
+        except ValueError:
+            logging.critical("invalid value for '{}' (expects an integer)".format(option))
+            exit(1)
+        else:
+            os.environ[var] = str(value)
+
     # Get UniProt info and flat file paths
     try:
         uniprot_version = config['UniProt']['version']
@@ -152,6 +255,16 @@ def main():
         if not len(queue):
             queue = None
 
+    # Number of tasks allowed to run heavy parallel queries at the same time (empty: not limited)
+    try:
+        oracle_parallel = int(config['cluster']['oracle_parallel'])
+    except KeyError:
+        pass
+    except ValueError:
+        if config['cluster']['oracle_parallel']:
+            logging.critical("invalid value for 'oracle_parallel' (expect an integer)")
+            exit(1)
+
     # STMP credentials to send reports
     try:
         smtp_host = config['mail']['server']
@@ -170,6 +283,7 @@ def main():
             name='load_swissprot',
             fn=ipu.proteins.read_flat_file,
             args=(swissprot_file, os.path.join(outdir, 'swiss.h5')),
+            cache=dict(inputs=[swissprot_file], outputs=[os.path.join(outdir, 'swiss.h5')]),
             lsf=dict(queue=queue, mem=500),
             log=os.path.join(outdir, 'load_swissprot')
         ),
@@ -177,6 +291,7 @@ def main():
             name='load_trembl',
             fn=ipu.proteins.read_flat_file,
             args=(trembl_file, os.path.join(outdir, 'trembl.h5')),
+            cache=dict(inputs=[trembl_file], outputs=[os.path.join(outdir, 'trembl.h5')]),
             lsf=dict(queue=queue, mem=30000),
             log=os.path.join(outdir, 'load_trembl')
         ),
@@ -184,6 +299,10 @@ def main():
             name='dump_db',
             fn=ipu.proteins.dump_proteins,
             args=(*db_user_pro, db_host, os.path.join(outdir, 'db.h5')),
+            cache=dict(
+                inputs=[functools.partial(ipu.proteins.get_checksum, *db_user_pro, db_host)],
+                outputs=[os.path.join(outdir, 'db.h5')]
+            ),
             lsf=dict(queue=queue, mem=16000),
             log=os.path.join(outdir, 'dump_db')
         ),
@@ -195,6 +314,10 @@ def main():
                 [os.path.join(outdir, 'swiss.h5'), os.path.join(outdir, 'trembl.h5')],
                 os.path.join(outdir, 'uniprot.h5')
             ),
+            cache=dict(
+                inputs=[os.path.join(outdir, 'swiss.h5'), os.path.join(outdir, 'trembl.h5')],
+                outputs=[os.path.join(outdir, 'uniprot.h5')]
+            ),
             lsf=dict(queue=queue, mem=5000),
             log=os.path.join(outdir, 'merge_h5')
         ),
@@ -238,7 +361,8 @@ def main():
             requires=['method_changes'],
             input=['load_swissprot', 'load_trembl'],
             args=(*db_user_pro, db_host, uniprot_version, uniprot_date),
-            kwargs=dict(outdir=outdir, workdir=tmpdir, queue=queue, iter=not args.lowmem),
+            kwargs=dict(outdir=outdir, workdir=tmpdir, queue=queue, iter=not args.lowmem,
+                        strategy=args.delete_strategy, count=not args.no_count),
             lsf=dict(queue=queue),
             log=os.path.join(outdir, 'update_proteins')
         ),
@@ -258,18 +382,45 @@ def main():
             name='iprscan_refresh',
             fn=ipu.iprscan.refresh,
             args=(*db_user_scan, db_host),
-            kwargs=dict(method='C', parallel=6, queue=queue, workdir=tmpdir, log=True),
+            kwargs=dict(method='C', parallel=6, queue=queue, workdir=tmpdir, log=True, site=False),
             lsf=dict(queue=queue),
             skip=True,
             log=os.path.join(outdir, 'iprscan_refresh')
         ),
 
+        # Refresh the partitions of IPRSCAN.SITE (one task per partition), then swap them
+        Task(
+            name='iprscan_site',
+            fn=ipu.iprscan.get_site_partitions,
+            map=Task(
+                fn=ipu.iprscan.refresh_site_partition,
+                args=(*db_user_scan, db_host, 'C'),
+                lsf=dict(queue=queue),
+                log=os.path.join(outdir, 'iprscan_site')
+            ),
+            lsf=dict(queue=queue),
+            skip=True,
+            log=os.path.join(outdir, 'iprscan_site')
+        ),
+        Task(
+            name='iprscan_site_swap',
+            fn=ipu.iprscan.exchange_site_partitions,
+            input=['iprscan_site'],
+            args=(*db_user_scan, db_host),
+            kwargs=dict(parallel=6),
+            pools={'oracle_parallel': 1},
+            lsf=dict(queue=queue),
+            skip=True,
+            log=os.path.join(outdir, 'iprscan_site_swap')
+        ),
+
         # Rebuild indexes and refresh PROTEIN_TO_SCAN
         Task(
             name='protein2scan',
             fn=ipu.iprscan.protein2scan,
             requires=['update_proteins', 'uniparc_xref'],
             args=(*db_user_pro, db_host),
+            pools={'oracle_parallel': 1},
             lsf=dict(queue=queue),
             log=os.path.join(outdir, 'protein2scan')
         ),
@@ -301,6 +452,7 @@ def main():
             fn=ipu.matches.prepare_matches,
             requires=['protein2scan'],
             args=(*db_user_pro, db_host),
+            pools={'oracle_parallel': 1},
             lsf=dict(queue=queue, mem=8000),  # add_new() requires ~500M, but pre_prod might require more
             log=os.path.join(outdir, 'prepare_matches')
         ),
@@ -310,6 +462,7 @@ def main():
             fn=ipu.feature_matches.prepare_feature_matches,
             requires=['protein2scan'],
             args=(*db_user_pro, db_host),
+            pools={'oracle_parallel': 1},
             lsf=dict(queue=queue, mem=8000),  # add_new() requires ~500M, but pre_prod might require more
             log=os.path.join(outdir, 'prepare_feature_matches')
         ),
@@ -320,6 +473,7 @@ def main():
             fn=ipu.iprscan.recreate_aa_iprscan,
             requires=['protein2scan'],
             args=(*db_user_scan, db_host),
+            pools={'oracle_parallel': 1},
             lsf=dict(queue=queue),
             log=os.path.join(outdir, 'aa_iprscan')
         ),
@@ -384,6 +538,7 @@ def main():
             fn=ipu.proteins.check_crc64,
             requires=['update_proteins', 'uniparc_xref'],
             args=(*db_user_pro, db_host),
+            pools={'oracle_parallel': 1},
             lsf=dict(queue=queue),
             log=os.path.join(outdir, 'crc64')
         ),
@@ -410,6 +565,16 @@ def main():
         )
     ]
 
+    # Profile requested tasks
+    unknown = set(args.profile) - set([t.name for t in tasks])
+    if unknown:
+        logging.critical('cannot profile unknown task(s): {}'.format(', '.join(sorted(unknown))))
+        exit(1)
+
+    for t in tasks:
+        if t.name in args.profile:
+            t.profile = os.path.join(outdir, t.name + '.prof')
+
     if args.detach:
         secs = 0
         cascade_kill = False
@@ -417,7 +582,31 @@ def main():
         secs = 10
         cascade_kill = True
 
-    w = Workflow(tasks, dir=tmpdir, db=os.path.join(outdir, 'workflow.db'), cascade_kill=cascade_kill)
+    if args.local is not None:
+        # Exported so that batches created by tasks also run locally
+        pool = LocalPool(max_tasks=args.local).export()
+    else:
+        pool = None
+
+    w = Workflow(tasks, dir=tmpdir, db=os.path.join(outdir, 'workflow.db'), cascade_kill=cascade_kill, pool=pool,
+                 pools={'oracle_parallel': oracle_parallel}, cache=not args.no_cache)
+
+    if args.report == 'usage':
+        print_usage(w.get_usage())
+        return
+    elif args.report == 'statements':
+        print_statements(w.get_statements())
+        return
+    elif args.report == 'gantt':
+        timeline = w.get_timeline(args.tasks)
+        print(gantt_text(timeline))
+
+        if args.svg:
+            with open(args.svg, 'wt') as fh:
+                fh.write(gantt_svg(timeline))
+
+        return
+
     w.run(args.tasks, process=(not args.list), incdep=(not args.nodep), secs=secs)
 
 
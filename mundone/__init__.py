@@ -2,10 +2,13 @@
 # -*- coding: utf-8 -*-
 
 from mundone._batch import Batch
+from mundone._local import LocalPool
+from mundone._report import gantt_svg, gantt_text
+from mundone._runner import TRACE_VAR
 from mundone._task import Task
 from mundone._workflow import Workflow
 
 __version_info__ = (0, 1, 2)
 __version__ = '.'.join(map(str, __version_info__))
 
-__all__ = ['Batch', 'Task', 'Workflow']
+__all__ = ['Batch', 'LocalPool', 'Task', 'TRACE_VAR', 'Workflow', 'gantt_svg', 'gantt_text']
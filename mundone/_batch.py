@@ -2,7 +2,10 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import time
+from concurrent import futures
+
+import mundone._task as tsk
+from mundone._local import LocalPool
 
 
 logging.basicConfig(
@@ -17,41 +20,50 @@ class Batch(object):
 
     :param tasks: tasks to run.
     :type tasks: list or tuple
-    :param kwargs: keyword arguments (*dir*: working directory)
+    :param kwargs: keyword arguments (*dir*: working directory; *threads*: maximum number of tasks running in threads of the current process; *pool*: :py:class:`LocalPool` running tasks on the local host instead of LSF, by default created from the ``MUNDONE_LOCAL`` environment variable)
     """
 
     def __init__(self, tasks, **kwargs):
         self.tasks = tasks
         self.results = []
         self.workdir = kwargs.get('dir')
+        self.threads = kwargs.get('threads', 4)
+        self.executor = None
+        self.pool = kwargs.get('pool') or LocalPool.from_env()
 
     def start(self):
         """Start all tasks.
         
         :return: self
         """
+        if any(t.thread for t in self.tasks) and self.executor is None:
+            self.executor = futures.ThreadPoolExecutor(max_workers=self.threads)
+
         for t in self.tasks:
             if t.name:
                 logging.info("task '{}' is now running".format(t.name))
 
-            t.start(dir=self.workdir)
+            t.start(dir=self.workdir, executor=self.executor, pool=self.pool)
 
         return self
 
     def wait(self, secs=60):
         """Blocks until all tasks have terminated.
 
-        :param secs: number of seconds to wait between checks.
+        :param secs: maximum number of seconds to wait between checks (checks also happen as soon as a task terminates).
         :type secs: int
         :return: self
         """
         resuts = []
         terminated = [False] * len(self.tasks)
 
-        while len(resuts) < len(self.tasks):
-            time.sleep(secs)
+        while True:
+            count = tsk.events()
             resuts = []
 
+            # One call to bjobs for all LSF tasks
+            tsk.poll_lsf(self.tasks)
+
             for i, task in enumerate(self.tasks):
                 if task.has_terminated():
                     resuts.append(task.collect())
@@ -64,7 +76,17 @@ class Batch(object):
                         else:
                             logging.error("task '{}' has failed".format(task.name))
 
+            if len(resuts) == len(self.tasks):
+                break
+
+            tsk.wait_for_events(count, secs)
+
         self.results = resuts
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
         return self
 
     def is_done(self):
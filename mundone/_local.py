@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import os
+
+
+# If set (e.g. "4" or "4,16000,8"), batches and workflows run tasks on the local host, through a pool
+# limited to that many tasks (and optionally that much memory in MB, and that many CPUs)
+ENV_VAR = 'MUNDONE_LOCAL'
+
+
+def _total_mem():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 1024 ** 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class LocalPool(object):
+    """A pool of local processes, limiting how many tasks run concurrently, and the resources they reserve.
+
+    Tasks wait in a queue, ordered by :py:attr:`Task.priority` (highest first), then by :py:attr:`Task.rank`
+    (tasks on the critical path of a workflow first), then by submission order.
+    The *mem* and *cpu* values of the :py:attr:`Task.lsf` dictionary are reserved while a task runs.
+    A task requiring more than the budget starts when no other task is running.
+
+    :param max_tasks: maximum number of tasks running concurrently (default: number of CPUs).
+    :param mem: memory budget in MB (default: physical memory of the host).
+    :param cpu: CPU budget (default: number of CPUs).
+    """
+
+    def __init__(self, max_tasks=None, mem=None, cpu=None):
+        self.max_tasks = max_tasks or os.cpu_count() or 1
+        self.mem = mem or _total_mem()
+        self.cpu = cpu or os.cpu_count() or 1
+
+        self.queue = []
+        self.running = []
+        self.counter = itertools.count()
+
+    @classmethod
+    def from_env(cls):
+        """Creates a pool from the :py:data:`ENV_VAR` environment variable.
+
+        :return: a pool, or ``None`` if the variable is not set.
+        :rtype: LocalPool
+        """
+        value = os.environ.get(ENV_VAR)
+        if not value:
+            return None
+
+        try:
+            values = [int(v) if v else None for v in value.split(',')]
+        except ValueError:
+            return None
+
+        return cls(*values[:3])
+
+    def export(self):
+        """Sets :py:data:`ENV_VAR`, so batches created by child processes also run their tasks on the local host.
+
+        :return: self
+        """
+        os.environ[ENV_VAR] = '{},{},{}'.format(self.max_tasks, self.mem or '', self.cpu)
+        return self
+
+    @staticmethod
+    def _requirements(task):
+        try:
+            mem = int(task.lsf['mem'])
+        except (KeyError, TypeError, ValueError):
+            mem = 100  # same default as bsub
+
+        try:
+            cpu = int(task.lsf['cpu'])
+        except (KeyError, TypeError, ValueError):
+            cpu = 1
+
+        return mem, cpu
+
+    def submit(self, task):
+        """Queues a packed task, and starts as many queued tasks as possible.
+
+        :param task: task to run.
+        """
+        heapq.heappush(self.queue, (-task.priority, -task.rank, next(self.counter), task))
+        self.dispatch()
+
+    def cancel(self, task):
+        """Removes a task from the queue.
+
+        :param task: queued task.
+        :return: ``True`` if the task was queued.
+        :rtype: bool
+        """
+        for i, item in enumerate(self.queue):
+            if item[3] is task:
+                self.queue.pop(i)
+                heapq.heapify(self.queue)
+                return True
+
+        return False
+
+    def dispatch(self):
+        """Releases the resources of terminated tasks, then starts queued tasks that fit in the budget.
+
+        :return: number of tasks started.
+        :rtype: int
+        """
+        self.running = [task for task in self.running if task.proc is not None and task.proc.poll() is None]
+
+        mem_used = sum(self._requirements(task)[0] for task in self.running)
+        cpu_used = sum(self._requirements(task)[1] for task in self.running)
+
+        cnt = 0
+        while self.queue and len(self.running) < self.max_tasks:
+            priority, rank, i, task = self.queue[0]
+            mem, cpu = self._requirements(task)
+
+            if self.running:
+                if self.mem and mem_used + mem > self.mem:
+                    break
+                elif cpu_used + cpu > self.cpu:
+                    break
+
+            heapq.heappop(self.queue)
+            task.spawn()
+            self.running.append(task)
+            mem_used += mem
+            cpu_used += cpu
+            cnt += 1
+
+        return cnt
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from xml.sax.saxutils import escape
+
+import mundone._task as tsk
+from mundone._workflow import _format_secs
+
+
+def get_concurrency(timeline):
+    """Returns the number of runs in progress over time.
+
+    :param timeline: runs, as returned by :py:meth:`Workflow.get_timeline`.
+    :return: list of (time, number of runs) tuples, each value holding until the next time.
+    :rtype: list
+    """
+    events = []
+    for obj in timeline:
+        events.append((obj['start'], 1))
+        events.append((obj['end'], -1))
+
+    steps = []
+    n = 0
+    for t, delta in sorted(events, key=lambda e: (e[0], e[1])):
+        n += delta
+        if steps and steps[-1][0] == t:
+            steps[-1] = (t, n)
+        else:
+            steps.append((t, n))
+
+    return steps
+
+
+def summarize(timeline):
+    """Summarizes a timeline.
+
+    :param timeline: runs, as returned by :py:meth:`Workflow.get_timeline`.
+    :return: dictionary (*makespan*, *busy*: sum of run durations, *parallelism*: average number of runs in progress, *max_concurrency*, *idle*: time without any run in progress, *critical_path*: list of task names, *critical_gaps*: sum of gaps on the critical path).
+    :rtype: dict
+    """
+    if not timeline:
+        return dict(makespan=0, busy=0, parallelism=0, max_concurrency=0, idle=0, critical_path=[], critical_gaps=0)
+
+    makespan = max(obj['end'] for obj in timeline)
+    busy = sum(obj['end'] - obj['start'] for obj in timeline)
+    steps = get_concurrency(timeline)
+
+    idle = 0
+    for (t1, n), (t2, _) in zip(steps, steps[1:]):
+        if not n:
+            idle += t2 - t1
+
+    critical = [obj for obj in timeline if obj['critical']]
+    return dict(
+        makespan=makespan,
+        busy=busy,
+        parallelism=busy / makespan if makespan else 0,
+        max_concurrency=max(n for t, n in steps),
+        idle=idle,
+        critical_path=[obj['name'] for obj in critical],
+        critical_gaps=sum(obj['gap'] or 0 for obj in critical)
+    )
+
+
+def gantt_text(timeline, width=80):
+    """Renders a timeline as text: one bar per run ('#' on the critical path, '!' if failed),
+    followed by the number of runs in progress over time, and a summary.
+
+    :param timeline: runs, as returned by :py:meth:`Workflow.get_timeline`.
+    :param width: number of characters of bars.
+    :rtype: str
+    """
+    if not timeline:
+        return 'no completed runs'
+
+    summary = summarize(timeline)
+    scale = width / summary['makespan'] if summary['makespan'] else 0
+    label_width = max(len(obj['name']) for obj in timeline) + 2
+
+    lines = ['{:<{}}{:>10}{:>10}{:>10}  {}'.format('task', label_width, 'start', 'duration', 'gap', '')]
+    for obj in timeline:
+        i = min(int(obj['start'] * scale), width - 1)
+        j = max(min(int(obj['end'] * scale), width), i + 1)
+
+        if obj['status'] == tsk.STATUS_ERROR:
+            c = '!'
+        elif obj['critical']:
+            c = '#'
+        else:
+            c = '='
+
+        lines.append('{:<{}}{:>10}{:>10}{:>10}  |{}{}{}|'.format(
+            obj['name'], label_width, _format_secs(obj['start']), _format_secs(obj['end'] - obj['start']),
+            _format_secs(obj['gap']), ' ' * i, c * (j - i), ' ' * (width - j)
+        ))
+
+    # Maximum number of runs in progress during each character
+    steps = get_concurrency(timeline)
+    bins = [0] * width
+    for (t1, n), (t2, _) in zip(steps, steps[1:]):
+        i = min(int(t1 * scale), width - 1)
+        j = max(min(int(t2 * scale), width), i + 1)
+        for k in range(i, j):
+            bins[k] = max(bins[k], n)
+
+    lines.append('{:<{}}{:>30}  |{}|'.format(
+        'concurrency', label_width, '',
+        ''.join(str(n) if n < 10 else '+' for n in bins).replace('0', ' ')
+    ))
+
+    lines += [
+        '',
+        'makespan: {}, busy: {}, average parallelism: {:.1f}, max concurrency: {}, idle: {}'.format(
+            _format_secs(summary['makespan']), _format_secs(summary['busy']), summary['parallelism'],
+            summary['max_concurrency'], _format_secs(summary['idle'])
+        ),
+        'critical path: {}'.format(' -> '.join(summary['critical_path'])),
+        'gaps on the critical path: {}'.format(_format_secs(summary['critical_gaps']))
+    ]
+
+    return '\n'.join(lines)
+
+
+def gantt_svg(timeline, width=1000):
+    """Renders a timeline as an SVG document: one bar per run (critical path in red, failed runs in grey),
+    gaps as orange lines before bars, and the number of runs in progress over time.
+
+    :param timeline: runs, as returned by :py:meth:`Workflow.get_timeline`.
+    :param width: width of the chart, in pixels.
+    :rtype: str
+    """
+    summary = summarize(timeline)
+    scale = width / summary['makespan'] if summary['makespan'] else 0
+    label_width = 8 * max([len(obj['name']) for obj in timeline] or [0]) + 10
+    row_height = 20
+    chart_height = 100
+    height = row_height * len(timeline) + chart_height + 60
+
+    elements = []
+    for k, obj in enumerate(timeline):
+        y = row_height * k + 10
+        x = label_width + obj['start'] * scale
+
+        if obj['status'] == tsk.STATUS_ERROR:
+            color = '#7f7f7f'
+        elif obj['critical']:
+            color = '#d62728'
+        else:
+            color = '#1f77b4'
+
+        elements.append('<text x="0" y="{}" font-size="12">{}</text>'.format(y + 13, escape(obj['name'])))
+
+        if obj['gap']:
+            elements.append('<line x1="{:.1f}" y1="{}" x2="{:.1f}" y2="{}" stroke="#ff7f0e" stroke-width="2"/>'.format(
+                x - obj['gap'] * scale, y + 8, x, y + 8
+            ))
+
+        elements.append(
+            '<rect x="{:.1f}" y="{}" width="{:.1f}" height="{}" fill="{}">'
+            '<title>{}: {} (gap: {})</title></rect>'.format(
+                x, y + 2, max((obj['end'] - obj['start']) * scale, 1), row_height - 4, color,
+                escape(obj['name']), _format_secs(obj['end'] - obj['start']), _format_secs(obj['gap'])
+            )
+        )
+
+    # Runs in progress over time
+    y0 = row_height * len(timeline) + 20 + chart_height
+    unit = chart_height / summary['max_concurrency'] if summary['max_concurrency'] else 0
+    points = []
+    y = y0
+    for t, n in get_concurrency(timeline):
+        x = label_width + t * scale
+        points.append('{:.1f},{:.1f}'.format(x, y))  # step
+        y = y0 - n * unit
+        points.append('{:.1f},{:.1f}'.format(x, y))
+
+    elements.append('<text x="0" y="{}" font-size="12">concurrency (max {})</text>'.format(
+        y0 - chart_height / 2, summary['max_concurrency']
+    ))
+    elements.append('<polyline points="{}" fill="none" stroke="#2ca02c" stroke-width="1.5"/>'.format(' '.join(points)))
+
+    elements.append(
+        '<text x="0" y="{}" font-size="12">makespan: {}, average parallelism: {:.1f}, '
+        'gaps on the critical path: {}</text>'.format(
+            y0 + 30, _format_secs(summary['makespan']), summary['parallelism'],
+            _format_secs(summary['critical_gaps'])
+        )
+    )
+
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}" font-family="monospace">\n{}\n</svg>\n'.format(
+            label_width + width + 10, height, '\n'.join(elements)
+        )
+    )
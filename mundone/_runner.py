@@ -1,14 +1,123 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import argparse
 import importlib
+import json
+import os
 import pickle
+import resource
 import struct
 import sys
+import time
+
+# Environment variable set to the path of a file tasks can append JSON records to (one per line),
+# e.g. to time the SQL statements they execute. Records are aggregated by tag once the task completes.
+TRACE_VAR = 'MUNDONE_TRACE'
+
+
+def get_usage():
+    """Returns the resources used by the current process and its children.
+
+    :return: dictionary of user/system CPU time (seconds), peak memory (MB), and bytes read/written.
+    :rtype: dict
+    """
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return dict(
+        user_time=usage_self.ru_utime + usage_children.ru_utime,
+        sys_time=usage_self.ru_stime + usage_children.ru_stime,
+        max_mem=max(usage_self.ru_maxrss, usage_children.ru_maxrss) / 1024,  # ru_maxrss is in KB (Linux)
+        read_bytes=(usage_self.ru_inblock + usage_children.ru_inblock) * 512,
+        write_bytes=(usage_self.ru_oublock + usage_children.ru_oublock) * 512
+    )
+
+
+def _profiled(fn, filepath, limit=25):
+    """Wraps a function so it runs under cProfile. Saves statistics to *filepath*, and writes hotspots to stderr."""
+    import cProfile
+    import pstats
+
+    def wrapper(*args, **kwargs):
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(fn, *args, **kwargs)
+        finally:
+            profiler.dump_stats(filepath)
+
+            stats = pstats.Stats(profiler, stream=sys.stderr)
+            stats.strip_dirs()
+            sys.stderr.write('profile saved to {}\n'.format(filepath))
+            stats.sort_stats('tottime').print_stats(limit)
+            stats.sort_stats('cumulative').print_stats(limit)
+
+    return wrapper
+
+
+def read_trace(filepath):
+    """Aggregates the records of a trace file by tag.
+
+    Numeric values (e.g. *elapsed*, *rows*) are summed; the longest *elapsed* value is kept as *max_elapsed*.
+
+    :param filepath: path of the trace file.
+    :return: list of dictionaries (*tag*, *executions*, *max_elapsed*, and summed values), slowest first.
+    :rtype: list
+    """
+    tags = {}
+    try:
+        with open(filepath, 'rt') as fh:
+            for line in fh:
+                try:
+                    rec = json.loads(line)
+                    tag = rec['tag']
+                except (ValueError, KeyError, TypeError):
+                    continue  # incomplete line (e.g. task killed while writing)
+
+                try:
+                    obj = tags[tag]
+                except KeyError:
+                    obj = tags[tag] = dict(tag=tag, executions=0, elapsed=0, max_elapsed=0)
+
+                obj['executions'] += 1
+                for k, v in rec.items():
+                    if k != 'tag' and isinstance(v, (int, float)):
+                        obj[k] = obj.get(k, 0) + v
+
+                obj['max_elapsed'] = max(obj['max_elapsed'], rec.get('elapsed') or 0)
+    except FileNotFoundError:
+        pass
+
+    return sorted(tags.values(), key=lambda obj: -obj['elapsed'])
+
+
+def _write_summary(records, limit=10):
+    sys.stderr.write('slowest statements:\n')
+    sys.stderr.write('{:>10}{:>10}{:>10}{:>12}{:>8}{:>10}{:>15}{:>15}  {}\n'.format(
+        'elapsed', 'max', 'count', 'rows', 'trips', 'DB CPU', 'logical reads', 'physical reads', 'tag'
+    ))
+    for obj in records[:limit]:
+        sys.stderr.write('{:>10.1f}{:>10.1f}{:>10}{:>12}{:>8}{:>10}{:>15}{:>15}  {}\n'.format(
+            obj['elapsed'], obj['max_elapsed'], obj['executions'], obj.get('rows', '-'), obj.get('round_trips', '-'),
+            '{:.1f}'.format(obj['db_cpu']) if 'db_cpu' in obj else '-',
+            obj.get('logical_reads', '-'), obj.get('physical_reads', '-'), obj['tag']
+        ))
 
 
 def main():
-    with open(sys.argv[1], 'rb') as fh:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('infile')
+    parser.add_argument('outfile')
+    parser.add_argument('--profile', help='run the task under cProfile, and save statistics to this file')
+    parser.add_argument('--trace', help='keep the trace file at this path (default: temporary file)')
+    options = parser.parse_args()
+
+    # Set for this process and its children (overriding the value inherited from a parent task)
+    tracefile = options.trace or options.outfile + '.trace'
+    open(tracefile, 'wt').close()
+    os.environ[TRACE_VAR] = tracefile
+
+    with open(options.infile, 'rb') as fh:
         k, l, = struct.unpack('<2I', fh.read(8))
 
         dirname = fh.read(k).decode()
@@ -19,8 +128,17 @@ def main():
 
         fn, args, kwargs = pickle.loads(fh.read())
 
+    if options.profile:
+        # Profiling requested: statistics saved to the given file
+        fn = _profiled(fn, options.profile)
+
+    ts = time.time()
     try:
         result = fn(*args, **kwargs)
+    except SystemExit as e:
+        # e.g. exit(1) after logging a critical error
+        result = None
+        status = e.code if isinstance(e.code, int) else 1
     except Exception as e:
         exc_type, exc_obj, exc_tb = sys.exc_info()
         sys.stderr.write('{}, line {}: {}\n'.format(exc_type, exc_tb.tb_lineno, e))
@@ -29,9 +147,25 @@ def main():
     else:
         status = 0
 
-    with open(sys.argv[2], 'wb') as fh:
+    wall_time = time.time() - ts
+
+    statements = read_trace(tracefile)
+    if statements:
+        _write_summary(statements)
+
+    if not options.trace:
+        os.unlink(tracefile)
+
+    with open(options.outfile, 'wb') as fh:
         pickle.dump(result, fh)
 
+    # Notifies the completion of the task (written once the output is complete)
+    tmp = options.outfile + '.status.tmp'
+    with open(tmp, 'wt') as fh:
+        json.dump(dict(status=status, wall_time=wall_time, statements=statements, **get_usage()), fh)
+
+    os.replace(tmp, options.outfile + '.status')
+
     exit(status)
 
 
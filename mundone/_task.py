@@ -1,12 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import hashlib
 import inspect
+import json
 import os
 import pickle
 import struct
 import sys
 import tempfile
+import threading
+import time
+import types
 
 from subprocess import Popen, PIPE, DEVNULL
 
@@ -16,6 +21,220 @@ STATUS_PENDING = None
 STATUS_RUNNING = 1
 STATUS_SUCCESS = 0
 STATUS_ERROR = 2
+STATUS_MAPPED = 3  # run of a map task whose function returned partitions: waiting for the tasks processing them
+
+# Minimum number of seconds between two calls to bjobs for the same task
+LSF_POLL_SECS = 30
+
+# Number of seconds between two checks for status files of LSF tasks
+WATCH_SECS = 0.5
+
+
+class _Events(object):
+    """Counts task terminations, so schedulers can block until a task terminates instead of sleeping."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.count = 0
+
+    def notify(self):
+        with self.cond:
+            self.count += 1
+            self.cond.notify_all()
+
+    def wait(self, count, timeout=None):
+        with self.cond:
+            self.cond.wait_for(lambda: self.count != count, timeout)
+            return self.count
+
+
+class _Watcher(object):
+    """Watches for status files written by ``_runner.py`` (LSF tasks, that may run on other hosts)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.paths = set()
+        self.thread = None
+
+    def add(self, path):
+        with self.lock:
+            self.paths.add(path)
+
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def discard(self, path):
+        with self.lock:
+            self.paths.discard(path)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.paths:
+                    self.thread = None
+                    return
+
+                found = [path for path in self.paths if os.path.isfile(path)]
+                self.paths.difference_update(found)
+
+            if found:
+                _events.notify()
+
+            time.sleep(WATCH_SECS)
+
+
+_events = _Events()
+_watcher = _Watcher()
+
+
+def events():
+    """Returns the number of task terminations notified so far, to be passed to :py:func:`wait_for_events`.
+
+    :rtype: int
+    """
+    return _events.count
+
+
+def wait_for_events(count, timeout=None):
+    """Blocks until a task terminates after :py:func:`events` returned *count*, or until *timeout* seconds have elapsed.
+
+    Tasks killed by LSF do not notify their termination: callers should always pass a *timeout*.
+
+    :param count: value returned by :py:func:`events`.
+    :param timeout: maximum number of seconds to wait.
+    :return: the number of task terminations notified so far.
+    :rtype: int
+    """
+    return _events.wait(count, timeout)
+
+
+def _watch_process(proc):
+    proc.wait()
+    _events.notify()
+
+
+def bjobs(job_ids):
+    """Queries the status of LSF jobs with a single call to bjobs.
+
+    :param job_ids: list of LSF job IDs.
+    :return: dictionary of job ID -> LSF status (e.g. RUN, DONE). Jobs unknown to LSF are missing.
+    :rtype: dict
+    """
+    if not job_ids:
+        return {}
+
+    args = ['bjobs', '-o', 'jobid stat', '-noheader'] + [str(job_id) for job_id in job_ids]
+    output = Popen(args, stdout=PIPE, stderr=PIPE).communicate()[0].decode()
+
+    statuses = {}
+    for line in output.splitlines():
+        try:
+            job_id, status = line.split()
+            statuses[int(job_id)] = status
+        except ValueError:
+            pass  # e.g. Job <job_id> is not found
+
+    return statuses
+
+
+def bkill(job_ids):
+    """Kills LSF jobs with a single call to bkill.
+
+    :param job_ids: list of LSF job IDs.
+    """
+    if job_ids:
+        Popen(['bkill'] + [str(job_id) for job_id in job_ids], stdout=PIPE, stderr=PIPE).communicate()
+
+
+def poll_lsf(tasks, force=False):
+    """Updates the status of running LSF tasks, with at most one call to bjobs.
+
+    Tasks whose status file exists, or polled less than :py:data:`LSF_POLL_SECS` seconds ago, are not queried.
+
+    :param tasks: list of tasks (tasks not submitted to LSF are ignored).
+    :param force: if ``True``, query all running LSF tasks, regardless of when they were last polled.
+    """
+    now = time.time()
+    to_poll = {}
+    for task in tasks:
+        if task.lsf_job_id is None or task.status not in (STATUS_PENDING, STATUS_RUNNING):
+            continue
+        elif task._read_status():
+            continue
+        elif force or now - task.lsf_polled >= LSF_POLL_SECS:
+            to_poll[task.lsf_job_id] = task
+
+    statuses = bjobs(list(to_poll))
+    for job_id, task in to_poll.items():
+        task.lsf_polled = now
+        task.status = {
+            # Not a mistake! A pending task is not ready to run:
+            # only running (i.e. ready) tasks can be submitted
+            'PEND': STATUS_RUNNING,
+            'RUN': STATUS_RUNNING,
+            'EXIT': STATUS_ERROR,
+            'DONE': STATUS_SUCCESS
+        }.get(statuses.get(job_id), STATUS_ERROR)
+
+
+def stop_tasks(tasks):
+    """Stops tasks, killing LSF jobs with a single call to bkill.
+
+    :param tasks: list of tasks.
+    """
+    bkill([
+        task.lsf_job_id for task in tasks
+        if task.future is None and task.proc is None and task.lsf_job_id is not None
+    ])
+
+    for task in tasks:
+        task.stop(kill=False)
+
+
+def hash_file(filepath, bufsize=1024 ** 2):
+    """Returns the SHA-256 digest of a file's content."""
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(bufsize), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def hash_code(fn):
+    """Returns the SHA-256 digest of the code of a function: its bytecode, constants, and names (including nested functions).
+
+    Functions wrapped by ``functools.partial`` are followed. For other callables, the source is used if available.
+    """
+    h = hashlib.sha256()
+
+    while hasattr(fn, 'func'):
+        fn = fn.func  # functools.partial
+
+    code = getattr(fn, '__code__', None)
+    if code is not None:
+        _update_code_hash(h, code)
+    else:
+        try:
+            h.update(inspect.getsource(fn).encode())
+        except (OSError, TypeError):
+            pass
+
+    return h.hexdigest()
+
+
+def _update_code_hash(h, code):
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _update_code_hash(h, const)
+        elif isinstance(const, frozenset):
+            # The order of set elements varies between processes
+            h.update(repr(sorted(const, key=repr)).encode())
+        else:
+            h.update(repr(const).encode())
 
 
 def mktemp(prefix=None, suffix=None, dir=None, isdir=False):
@@ -53,7 +272,13 @@ class Task(object):
         * **input** -- list of task names whose results are passed to :py:attr:`fn`.
         * **lsf** -- dictionary of LSF parameters (*queue*, *mem*, *cpu*, *tmp*).
         * **skip** -- if ``True``, the step is skipped when running the entire workflow.
-        * **log** -- if a file path, logs *stdout* and *stderr* in files having *log* as prefix; if ``False``, disables the logging.
+        * **log** -- if a file path, logs *stdout* and *stderr* in files having *log* as prefix (records appended to the trace file, e.g. timed SQL statements, are also kept, with the *.trace* extension); if ``False``, disables the logging.
+        * **pools** -- dictionary of resource pool name -> number of tokens the task holds while running (see :py:class:`Workflow`).
+        * **map** -- :py:class:`Task` used as template: when run by a :py:class:`Workflow`, :py:attr:`fn` returns a list of partitions (JSON-serializable values), and one task is created per partition, with the partition as first argument, followed by the arguments of the template. The result of the task is the list of the results of these tasks.
+        * **cache** -- dictionary declaring the *inputs* of the task (list of file paths, or of functions returning a value identifying an input, e.g. a checksum), its *outputs* (list of file paths), and whether input files are identified by their content (*hash*: ``True``) rather than by their size and modification time. When run by a :py:class:`Workflow`, a task whose function (its name and code, but not the code of the functions it calls), arguments, and inputs did not change since a successful run is not run again, as long as its outputs did not change either: the previous result is reused.
+        * **profile** -- if a file path, :py:attr:`fn` runs under cProfile, and statistics are saved to this file (hotspots are written to *stderr*).
+        * **priority** -- tasks with a higher priority leave the queue of a :py:class:`LocalPool` first.
+        * **thread** -- if ``True``, the task runs in a thread of the calling process when started by a :py:class:`Batch` (for short tasks, e.g. a single SQL statement); *lsf* and *log* are then ignored.
 
 
     """
@@ -72,9 +297,13 @@ class Task(object):
         self.kwargs = kwargs
 
         self.lsf_job_id = None
+        self.lsf_polled = 0
         self.proc = None
+        self.future = None
+        self.pool = None
         self.status = STATUS_PENDING
         self.output = None
+        self.stats = {}  # resources used, as reported by _runner.py
 
         self.name = _kwargs.get('name')
 
@@ -102,6 +331,14 @@ class Task(object):
 
         self.lsf = _kwargs['lsf'] if _kwargs.get('lsf') and isinstance(_kwargs['lsf'], dict) else {}
         self.skip = _kwargs.get('skip', False)
+        self.thread = _kwargs.get('thread', False)
+        self.priority = _kwargs.get('priority', 0)
+        self.profile = _kwargs.get('profile') if isinstance(_kwargs.get('profile'), str) else None
+        self.rank = 0  # set by Workflow: predicted number of seconds from the start of this task to the end of the workflow
+        self.pools = _kwargs['pools'] if _kwargs.get('pools') and isinstance(_kwargs['pools'], dict) else {}
+        self.cache = _kwargs['cache'] if isinstance(_kwargs.get('cache'), dict) else None
+        self.map = _kwargs['map'] if isinstance(_kwargs.get('map'), Task) else None
+        self.cache_key = None  # set by Workflow
 
         if _kwargs.get('log') and isinstance(_kwargs['log'], str):
             self.log = (_kwargs['log'] + '.out', _kwargs['log'] + '.err')
@@ -113,6 +350,86 @@ class Task(object):
         self.infile = None
         self.outfile = None
 
+    @property
+    def statusfile(self):
+        """Path of the file in which ``_runner.py`` writes the exit status of :py:attr:`fn`."""
+        return self.outfile + '.status' if self.outfile else None
+
+    def partition(self, value, index, name):
+        """Creates the task processing a partition, using this task as template (see *map*).
+
+        :param value: partition, passed as first argument.
+        :param index: index of the partition (suffix of log/profile files).
+        :param name: name of the task.
+        :rtype: Task
+        """
+        if self.log:
+            # Log/profile files suffixed by the partition index
+            log = '{}.{}'.format(os.path.splitext(self.log[0])[0], index)
+        else:
+            log = self.log
+
+        if self.profile:
+            root, ext = os.path.splitext(self.profile)
+            profile = '{}.{}{}'.format(root, index, ext)
+        else:
+            profile = None
+
+        return Task(
+            fn=self.fn,
+            args=[value] + self.args,
+            kwargs=self.kwargs,
+            name=name,
+            lsf=self.lsf,
+            log=log,
+            pools=self.pools,
+            priority=self.priority,
+            profile=profile
+        )
+
+    def fingerprint(self, input_args=list(), hash_fn=hash_file):
+        """Identifies the function, arguments, and inputs of a task declaring its inputs (see *cache*).
+
+        :param input_args: arguments passed by the tasks listed in :py:attr:`input`.
+        :param hash_fn: function returning the digest of a file, used if the *hash* value of *cache* is ``True``.
+        :return: SHA-256 digest, or ``None`` if the task does not declare its inputs, or an input cannot be identified (e.g. missing file).
+        :rtype: str
+        """
+        if self.cache is None:
+            return None
+
+        args = input_args + self.args if isinstance(input_args, list) else self.args
+        try:
+            p = pickle.dumps((self.fn, args, sorted(self.kwargs.items())), protocol=4)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return None
+
+        h = hashlib.sha256(p)
+
+        # The function is pickled by name: also identify its code, so a fixed function runs again
+        h.update(hash_code(self.fn).encode())
+
+        for obj in self.cache.get('inputs', []):
+            if callable(obj):
+                try:
+                    value = repr(obj())
+                except Exception:
+                    return None
+            else:
+                try:
+                    st = os.stat(obj)
+                except (FileNotFoundError, TypeError):
+                    return None
+
+                if self.cache.get('hash'):
+                    value = '{}:{}'.format(obj, hash_fn(obj))
+                else:
+                    value = '{}:{}:{}'.format(obj, st.st_size, st.st_mtime_ns)
+
+            h.update(value.encode())
+
+        return h.hexdigest()
+
     def pack(self, input_args=list(), workdir=None):
         """
 
@@ -161,14 +478,28 @@ class Task(object):
     def start(self, **kwargs):
         """Start a task.
 
-        :param kwargs: keyword arguments (*input*: list of additional parameters to pass to :py:attr:`fn`; *dir*: workdir directory)
+        :param kwargs: keyword arguments (*input*: list of additional parameters to pass to :py:attr:`fn`; *dir*: workdir directory; *executor*: ``concurrent.futures.Executor`` running tasks having the *thread* flag; *pool*: :py:class:`LocalPool` running tasks on the local host)
         """
         input_args = kwargs.get('input', list())
         workdir = kwargs.get('dir')
+        executor = kwargs.get('executor')
+        pool = kwargs.get('pool')
+
+        if self.thread and executor is not None:
+            args = input_args + self.args if isinstance(input_args, list) else self.args
+            self.future = executor.submit(self._run, self.fn, args, self.kwargs)
+            self.future.add_done_callback(lambda future: _events.notify())
+            self.status = STATUS_RUNNING
+            return
 
         self.pack(input_args, workdir)
 
-        if self.lsf:
+        if pool is not None:
+            # Runs on the local host, when the pool has room for it (LSF parameters are used as requirements)
+            self.pool = pool
+            self.status = STATUS_RUNNING
+            pool.submit(self)
+        elif self.lsf:
             args = ['bsub']
 
             if self.lsf.get('queue') and isinstance(self.lsf['queue'], str):
@@ -214,12 +545,7 @@ class Task(object):
                     '-e', err,
                 ]
 
-            args += [
-                sys.executable,
-                os.path.realpath(_runner.__file__),
-                self.infile,
-                self.outfile
-            ]
+            args += self._runner_args()
 
             output = Popen(args, stdout=PIPE).communicate()[0].strip().decode()
 
@@ -230,35 +556,70 @@ class Task(object):
                 self.status = STATUS_ERROR
             else:
                 self.lsf_job_id = job_id
+                self.lsf_polled = time.time()
                 self.status = STATUS_RUNNING
+                _watcher.add(self.statusfile)
         else:
-            args = [
-                sys.executable,
-                os.path.realpath(_runner.__file__),
-                self.infile,
-                self.outfile
-            ]
+            self.spawn()
 
-            if self.log is False:
-                out = err = DEVNULL
-            elif self.log is None:
-                out = err = None
-            else:
-                out = open(self.log[0], 'wt')
-                err = open(self.log[1], 'wt')
-                self.log = (out, err)
+    def _runner_args(self):
+        args = [
+            sys.executable,
+            os.path.realpath(_runner.__file__),
+            self.infile,
+            self.outfile
+        ]
 
-            self.proc = Popen(args, stdout=out, stderr=err)
-            self.status = STATUS_RUNNING
+        if self.profile:
+            args += ['--profile', self.profile]
+
+        if self.log and isinstance(self.log[0], str):
+            # Trace kept next to the log files
+            args += ['--trace', os.path.splitext(self.log[0])[0] + '.trace']
+
+        return args
+
+    def spawn(self):
+        """Runs a packed task in a process of the local host.
+
+        """
+        args = self._runner_args()
+
+        if self.log is False:
+            out = err = DEVNULL
+        elif self.log is None:
+            out = err = None
+        else:
+            out = open(self.log[0], 'wt')
+            err = open(self.log[1], 'wt')
+            self.log = (out, err)
+
+        self.proc = Popen(args, stdout=out, stderr=err)
+        self.status = STATUS_RUNNING
+        threading.Thread(target=_watch_process, args=(self.proc,), daemon=True).start()
+
+    @staticmethod
+    def _run(fn, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            exc_type, exc_obj, exc_tb = sys.exc_info()
+            sys.stderr.write('{}, line {}: {}\n'.format(exc_type, exc_tb.tb_lineno, e))
+            raise
 
-    def stop(self):
-        """Stops the task by killing the running process.
+    def stop(self, kill=True):
+        """Stops the task by killing the running process (tasks running in a thread cannot be interrupted, only cancelled if not started yet).
 
+        :param kill: if ``False``, LSF jobs are not killed (e.g. because they were already killed by :py:func:`stop_tasks`).
         """
-        if self.proc is not None:
+        if self.future is not None:
+            self.future.cancel()
+        elif self.pool is not None and self.proc is None:
+            self.pool.cancel(self)
+        elif self.proc is not None:
             self.proc.kill()
-        elif self.lsf_job_id is not None:
-            Popen(['bkill', str(self.lsf_job_id)], stdout=PIPE).communicate()[0].strip().decode()
+        elif self.lsf_job_id is not None and kill:
+            bkill([self.lsf_job_id])
 
         self.status = STATUS_ERROR
         self.clean()
@@ -319,6 +680,15 @@ class Task(object):
             except AttributeError:
                 pass
 
+        if self.future is not None:
+            if self.future.done() and not self.future.cancelled() and self.future.exception() is None:
+                self.output = self.future.result()
+
+            return self.output
+
+        if not self.stats:
+            self.stats = self.read_stats(self.statusfile) or {}
+
         try:
             with open(self.outfile, 'rb') as fh:
                 result = pickle.load(fh)
@@ -331,7 +701,7 @@ class Task(object):
             return self.output
 
     def clean(self):
-        """Deletes the input and output Pickle files. Called by :py:meth:`collect`.
+        """Deletes the input and output Pickle files (and the status and temporary trace files). Called by :py:meth:`collect`.
 
         """
         try:
@@ -341,6 +711,20 @@ class Task(object):
         finally:
             self.infile = None
 
+        if self.outfile:
+            _watcher.discard(self.statusfile)
+
+            try:
+                os.unlink(self.statusfile)
+            except FileNotFoundError:
+                pass
+
+            # Left by the runner if it was killed
+            try:
+                os.unlink(self.outfile + '.trace')
+            except FileNotFoundError:
+                pass
+
         try:
             os.unlink(self.outfile)
         except (FileNotFoundError, TypeError):
@@ -352,7 +736,21 @@ class Task(object):
         """Checks the current status of the task.
 
         """
-        if self.proc is not None:
+        if self.pool is not None and self.proc is None:
+            # Still queued
+            self.pool.dispatch()
+            if self.proc is None:
+                self.status = STATUS_RUNNING
+                return
+
+        if self.future is not None:
+            if not self.future.done():
+                self.status = STATUS_RUNNING
+            elif self.future.cancelled() or self.future.exception() is not None:
+                self.status = STATUS_ERROR
+            else:
+                self.status = STATUS_SUCCESS
+        elif self.proc is not None:
             returncode = self.proc.poll()
 
             if returncode is None:
@@ -362,19 +760,38 @@ class Task(object):
             else:
                 self.status = STATUS_ERROR
         elif self.lsf_job_id is not None:
-            output = Popen(['bjobs', str(self.lsf_job_id)], stdout=PIPE, stderr=PIPE).communicate()[0].strip().decode()
+            poll_lsf([self])
 
-            status = None
-            try:
-                status = output.splitlines()[1].split()[2]
-            except IndexError:
-                pass
-            finally:
-                self.status = {
-                    # Not a mistake! A pending task is not ready to run:
-                    # only running (i.e. ready) tasks can be submitted
-                    'PEND': STATUS_RUNNING,
-                    'RUN': STATUS_RUNNING,
-                    'EXIT': STATUS_ERROR,
-                    'DONE': STATUS_SUCCESS
-                }.get(status, STATUS_ERROR)
+    @staticmethod
+    def read_stats(filepath):
+        """Reads a status file written by ``_runner.py``.
+
+        :param filepath: path of the status file.
+        :return: dictionary with the exit status (*status*) and the resources used (see ``_runner.get_usage()``), or ``None`` if the file does not exist (yet).
+        :rtype: dict
+        """
+        try:
+            with open(filepath, 'rt') as fh:
+                stats = json.load(fh)
+        except (FileNotFoundError, TypeError, ValueError):
+            return None
+
+        if isinstance(stats, int):
+            # Written by a previous version of _runner.py
+            stats = dict(status=stats)
+
+        return stats
+
+    def _read_status(self):
+        """Sets the status of an LSF task from the status file written by ``_runner.py``, if it exists.
+
+        :return: ``True`` if the status file was found.
+        :rtype: bool
+        """
+        stats = self.read_stats(self.statusfile)
+        if stats is None:
+            return False
+
+        self.stats = stats
+        self.status = STATUS_SUCCESS if stats.get('status') == 0 else STATUS_ERROR
+        return True
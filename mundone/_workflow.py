@@ -5,9 +5,9 @@ import json
 import logging
 import os
 import sqlite3
-import time
 
 import mundone._task as tsk
+from mundone._local import LocalPool
 
 
 logging.basicConfig(
@@ -16,19 +16,46 @@ logging.basicConfig(
     datefmt='%y-%m-%d %H:%M:%S'
 )
 
+# Resources used by runs, as reported by _runner.py (column name, type)
+STATS_COLUMNS = [
+    ('exit_status', 'INTEGER'),
+    ('wall_time', 'REAL'),
+    ('user_time', 'REAL'),
+    ('sys_time', 'REAL'),
+    ('max_mem', 'REAL'),
+    ('read_bytes', 'INTEGER'),
+    ('write_bytes', 'INTEGER')
+]
+
+# Values of the statements timed by runs, aggregated by tag (column name, type).
+# Session statistics (reads, redo, DB CPU/time) are only recorded if tasks capture them
+STATEMENT_COLUMNS = [
+    ('rows', 'INTEGER'),
+    ('round_trips', 'INTEGER'),
+    ('logical_reads', 'INTEGER'),
+    ('physical_reads', 'INTEGER'),
+    ('redo_size', 'INTEGER'),
+    ('db_cpu', 'REAL'),
+    ('db_time', 'REAL')
+]
+
 
 class Workflow(object):
     """A workflow object represent a collection of :py:class:`Task` that might depend on each other.
 
     :param tasks: tasks to run.
-    :param kwargs: keyword arguments (*dir*: working directory; *db*: file path of the SQLite database that contains results).
+    :param kwargs: keyword arguments (*dir*: working directory; *db*: file path of the SQLite database that contains results; *pool*: :py:class:`LocalPool` running tasks on the local host instead of LSF, by default created from the ``MUNDONE_LOCAL`` environment variable; *pools*: dictionary of resource pool name -> capacity, i.e. the number of tokens that running tasks can hold at the same time; pools without capacity are not limited; *cache*: if ``False``, tasks declaring their inputs run even if unchanged since a successful run).
 
     """
     def __init__(self, tasks, **kwargs):
         self.db = kwargs.get('db')
         self.workdir = kwargs.get('dir')
         self.cascade_kill = kwargs.get('cascade_kill', True)
+        self.pool = kwargs.get('pool') or LocalPool.from_env()
+        self.pools = kwargs.get('pools', {})
+        self.use_cache = kwargs.get('cache', True)
         self.tasks = {}
+        self.children = {}  # ID of map task -> IDs of the tasks processing its partitions
 
         try:
             os.makedirs(self.workdir)
@@ -104,6 +131,58 @@ class Workflow(object):
             """
         )
 
+        # Statements timed by runs (see _runner.TRACE_VAR), aggregated by tag. run_id is the rowid of the run
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS statement (
+              run_id INTEGER NOT NULL,
+              tag TEXT NOT NULL,
+              executions INTEGER NOT NULL,
+              elapsed REAL NOT NULL,
+              max_elapsed REAL NOT NULL
+            )
+            """
+        )
+
+        # Results of successful runs, by fingerprint of the task (see Task.fingerprint)
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+              key TEXT NOT NULL PRIMARY KEY,
+              task_id INTEGER NOT NULL,
+              result TEXT DEFAULT NULL,
+              outputs TEXT NOT NULL,
+              create_time TEXT NOT NULL,
+              FOREIGN KEY(task_id) REFERENCES task(id)
+            )
+            """
+        )
+
+        # Checksums of input files, not computed again while the file does not change
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS file_hash (
+              path TEXT NOT NULL PRIMARY KEY,
+              size INTEGER NOT NULL,
+              mtime INTEGER NOT NULL,
+              digest TEXT NOT NULL
+            )
+            """
+        )
+
+        # Databases created before resources were recorded, or before results were cached
+        cur.execute('PRAGMA table_info(run)')
+        columns = [row[1] for row in cur.fetchall()]
+        for col_name, col_type in STATS_COLUMNS + [('cache_key', 'TEXT')]:
+            if col_name not in columns:
+                cur.execute('ALTER TABLE run ADD COLUMN {} {} DEFAULT NULL'.format(col_name, col_type))
+
+        cur.execute('PRAGMA table_info(statement)')
+        columns = [row[1] for row in cur.fetchall()]
+        for col_name, col_type in STATEMENT_COLUMNS:
+            if col_name not in columns:
+                cur.execute('ALTER TABLE statement ADD COLUMN {} {} DEFAULT NULL'.format(col_name, col_type))
+
         cur.execute('SELECT id, name FROM task')
         db_tasks = {name: task_id for task_id, name in cur}
         d_tasks = {}
@@ -131,7 +210,7 @@ class Workflow(object):
         :type task_names: list or tuple
         :param rerun:
         :type rerun: bool
-        :param secs: number of seconds to wait between checks.
+        :param secs: maximum number of seconds to wait between checks (checks also happen as soon as a task terminates).
         :type secs: int
         :param process:
         :type process: bool
@@ -140,24 +219,65 @@ class Workflow(object):
         """
         task_ids = self._init_runs(task_names, rerun=rerun, incdep=incdep, commit=process)
 
+        # Prioritize tasks on the critical path, from the durations of previous runs
+        durations = self._get_durations()
+        ranks = self._rank(task_ids, durations)
+        for task_id, rank in ranks.items():
+            self.tasks[task_id].rank = rank
+
         if not process:
             logging.info(
                 'tasks about to be processed: {}'.format(
                     ', '.join(sorted([self.tasks[task_id].name for task_id in task_ids]))
                 )
             )
+
+            if task_ids:
+                makespan = self._predict(task_ids, durations)
+                path = self._critical_path(task_ids, ranks)
+                logging.info('predicted duration: {} (critical path: {})'.format(
+                    _format_secs(makespan), ' -> '.join(self.tasks[task_id].name for task_id in path)
+                ))
+
+                unknown = sorted([self.tasks[task_id].name for task_id in task_ids if task_id not in durations])
+                if unknown:
+                    logging.info('no previous run for: {} (assumed duration: {})'.format(
+                        ', '.join(unknown), _format_secs(self._default_duration(durations))
+                    ))
+
             return
 
         names2ids = {task.name: task_id for task_id, task in self.tasks.items()}
 
+        waiting = set()
+        fingerprinted = set()
+
         while self.active:
+            count = tsk.events()
             runs = self._get_runs()
 
+            # When tasks compete for resources, those with the longest remaining path start first
+            # (sorted at each iteration, as map tasks add tasks)
+            order = sorted(self.tasks, key=lambda task_id: (-self.tasks[task_id].priority, -self.tasks[task_id].rank))
+
+            # One call to bjobs for all LSF tasks
+            tsk.poll_lsf(list(self.tasks.values()))
+
             runs_started = []
             runs_terminated = []
             keep_running = False
+            resumed = False  # tasks created for the partitions of a resumed map task: start them without waiting
+
+            # Resource pool tokens held by running tasks
+            tokens = {}
+            for task_id, run in runs.items():
+                if run['status'] == tsk.STATUS_RUNNING and task_id in self.tasks:
+                    for pool_name, n in self.tasks[task_id].pools.items():
+                        tokens[pool_name] = tokens.get(pool_name, 0) + n
+
+            for task_id in order:
+                task = self.tasks[task_id]
 
-            for task_id, task in self.tasks.items():
                 try:
                     run = runs[task_id]
                 except KeyError:
@@ -170,9 +290,46 @@ class Workflow(object):
                         else:
                             logging.error("task '{}' has failed".format(task.name))
 
-                        runs_terminated.append((task_id, task.status, task.collect()))
+                        result = task.collect()
+
+                        if task.is_done() and task.map is not None:
+                            if isinstance(result, (list, tuple)):
+                                # One task per partition: results collected once they all terminated
+                                self._map(task_id, list(result))
+                                logging.info("task '{}' mapped over {} partition(s)".format(task.name, len(result)))
+                                runs_terminated.append((task_id, tsk.STATUS_MAPPED, list(result), task.stats))
+                                keep_running = True  # tasks of the partitions are yet to run
+                            else:
+                                logging.error("task '{}' did not return a list of partitions".format(task.name))
+                                runs_terminated.append((task_id, tsk.STATUS_ERROR, None, task.stats))
+                        else:
+                            runs_terminated.append((task_id, task.status, result, task.stats))
+
+                        for pool_name, n in task.pools.items():
+                            tokens[pool_name] -= n
                     else:
                         keep_running = True
+                elif run['status'] == tsk.STATUS_MAPPED:
+                    keep_running = True
+
+                    if task_id not in self.children:
+                        # Resumed run: partitions stored as the result of the run
+                        self._map(task_id, run['output'][0], resume=True)
+                        resumed = True
+                        continue
+
+                    statuses = [runs[i]['status'] if i in runs else None for i in self.children[task_id]]
+                    if all(status == tsk.STATUS_SUCCESS for status in statuses):
+                        logging.info("task '{}' has terminated".format(task.name))
+                        results = [(runs[i]['output'] or [None])[0] for i in self.children[task_id]]
+                        runs_terminated.append((task_id, tsk.STATUS_SUCCESS, results, None))
+                    elif all(status in (tsk.STATUS_SUCCESS, tsk.STATUS_ERROR) for status in statuses):
+                        logging.error("task '{}' has failed ({} of {} partitions failed)".format(
+                            task.name, statuses.count(tsk.STATUS_ERROR), len(statuses)
+                        ))
+
+                        # Partitions kept, so a new run processes only the partitions that failed
+                        runs_terminated.append((task_id, tsk.STATUS_ERROR, run['output'][0], None))
                 elif run['status'] == tsk.STATUS_PENDING:
                     keep_running = True
                     flag = 0
@@ -211,28 +368,338 @@ class Workflow(object):
                         continue
                     elif flag & 2:
                         # step cannot run because one or more dependencies failed: flag this run as failed too
-                        runs_terminated.append((task_id, tsk.STATUS_ERROR, None))
+                        runs_terminated.append((task_id, tsk.STATUS_ERROR, None, {}))
                     elif not flag & 4:
-                        # ready to be submitted
                         args = []
 
                         for dependency_name in task.input:
                             dependency_run = runs[names2ids[dependency_name]]  # todo: fix since it raises a KeyError if there is no run for the task
                             args += dependency_run['output']  # output is always a list
 
-                        task.start(input=args, dir=self.workdir)
+                        # Skip tasks whose function, arguments, inputs, and outputs did not change since a successful run
+                        if task_id not in fingerprinted:
+                            fingerprinted.add(task_id)
+                            task.cache_key = task.fingerprint(args, self._hash_file) if self.use_cache else None
+
+                            if task.cache_key is not None:
+                                found, result = self._get_cached(task.cache_key)
+                                if found:
+                                    logging.info("task '{}' is unchanged: result of a previous run reused".format(
+                                        task.name
+                                    ))
+                                    runs_terminated.append((task_id, tsk.STATUS_SUCCESS, result, {}))
+                                    continue
+
+                        # ready to be submitted, if resource pools have enough tokens left
+                        full = self._full_pools(task, tokens)
+                        if full:
+                            if task.name not in waiting:
+                                logging.info("task '{}' is waiting for pool(s): {}".format(task.name, ', '.join(full)))
+                                waiting.add(task.name)
+
+                            continue
+
+                        for pool_name, n in task.pools.items():
+                            tokens[pool_name] = tokens.get(pool_name, 0) + n
+
+                        task.start(input=args, dir=self.workdir, pool=self.pool)
                         logging.info("task '{}' is now running".format(task.name))
-                        runs_started.append((task_id, task.infile, task.outfile))
+                        runs_started.append((task_id, task.infile, task.outfile, task.cache_key))
 
             if runs_started or runs_terminated:
                 self._update_runs(runs_started, runs_terminated)
 
             if secs:
                 self.active = keep_running
-                time.sleep(secs)
+
+                if keep_running and not runs_terminated and not resumed:
+                    # Wakes up as soon as a task terminates (at the latest after secs seconds)
+                    tsk.wait_for_events(count, secs)
             else:
                 break
 
+    def get_usage(self):
+        """Summarizes the resources used by past runs of each task (runs without recorded resources are ignored).
+
+        :return: list of dictionaries (*name*, *runs*, *failed*, *avg_wall_time*, *max_wall_time*, *avg_cpu_time*, *max_mem*, *req_mem*, *avg_read_bytes*, *avg_write_bytes*).
+        :rtype: list
+        """
+        con = sqlite3.connect(self.db)
+        cur = con.cursor()
+        cur.execute('SELECT T.name, COUNT(*), SUM(CASE WHEN R.exit_status != 0 THEN 1 ELSE 0 END), '
+                    '  AVG(R.wall_time), MAX(R.wall_time), AVG(R.user_time + R.sys_time), MAX(R.max_mem), '
+                    '  AVG(R.read_bytes), AVG(R.write_bytes) '
+                    'FROM run R '
+                    'INNER JOIN task T ON R.task_id = T.id '
+                    'WHERE R.wall_time IS NOT NULL '
+                    'GROUP BY T.name '
+                    'ORDER BY T.name')
+
+        names2tasks = {task.name: task for task in self.tasks.values()}
+        usage = []
+        for row in cur:
+            obj = dict(zip(['name', 'runs', 'failed', 'avg_wall_time', 'max_wall_time', 'avg_cpu_time', 'max_mem',
+                            'avg_read_bytes', 'avg_write_bytes'], row))
+
+            task = names2tasks.get(obj['name'])
+            obj['req_mem'] = task.lsf.get('mem') if task is not None else None
+            usage.append(obj)
+
+        cur.close()
+        con.close()
+
+        return usage
+
+    def get_statements(self, limit=20):
+        """Returns the slowest statements timed by the last run of each task (only runs that timed statements).
+
+        :param limit: maximum number of statements.
+        :return: list of dictionaries (*name*, *tag*, *executions*, *elapsed*, *max_elapsed*, and the columns of :py:data:`STATEMENT_COLUMNS`).
+        :rtype: list
+        """
+        keys = ['name', 'tag', 'executions', 'elapsed', 'max_elapsed'] + [col for col, _ in STATEMENT_COLUMNS]
+
+        con = sqlite3.connect(self.db)
+        cur = con.cursor()
+        cur.execute('SELECT T.name, S.tag, S.executions, S.elapsed, S.max_elapsed, {} '
+                    'FROM statement S '
+                    'INNER JOIN run R ON S.run_id = R.rowid '
+                    'INNER JOIN task T ON R.task_id = T.id '
+                    'WHERE S.run_id IN ('
+                    '  SELECT MAX(S2.run_id) '
+                    '  FROM statement S2 '
+                    '  INNER JOIN run R2 ON S2.run_id = R2.rowid '
+                    '  GROUP BY R2.task_id'
+                    ') '
+                    'ORDER BY S.elapsed DESC '
+                    'LIMIT ?'.format(', '.join('S.' + col for col, _ in STATEMENT_COLUMNS)), (limit,))
+
+        statements = [dict(zip(keys, row)) for row in cur]
+
+        cur.close()
+        con.close()
+
+        return statements
+
+    def get_timeline(self, task_names=None):
+        """Returns the last completed run of each task, and the critical path observed during these runs.
+
+        Times are in seconds since the start of the earliest run. The *gap* of a run is the time between the end
+        of its last dependency and its start (e.g. delay until the workflow polled the dependency, or waiting for a pool).
+        The critical path starts from the run that ended last, and goes back through the dependency that ended last.
+
+        Runs of the tasks processing the partitions of map tasks are included (without dependencies).
+
+        :param task_names: tasks to include (default: all).
+        :return: list of dictionaries (*name*, *status*, *start*, *end*, *requires*, *gap*, *critical*), by start time.
+        :rtype: list
+        """
+        names = {task.name for task in self.tasks.values()}
+
+        con = sqlite3.connect(self.db)
+        cur = con.cursor()
+        cur.execute('SELECT id, name FROM task')
+        ids2names = dict(cur.fetchall())
+
+        cur.execute('SELECT task_id, status, julianday(start_time) * 86400, julianday(end_time) * 86400 '
+                    'FROM run '
+                    'WHERE start_time IS NOT NULL '
+                    'AND end_time IS NOT NULL '
+                    'ORDER BY rowid')
+
+        runs = {}
+        for task_id, status, start, end in cur:
+            name = ids2names.get(task_id, '').rsplit(':', 1)[0]  # name of the map task for partitions
+            if name in names and (not task_names or name in task_names):
+                runs[task_id] = (status, start, end)  # most recent run last
+
+        cur.close()
+        con.close()
+
+        if not runs:
+            return []
+
+        t0 = min(start for status, start, end in runs.values())
+        declared = [task_id for task_id in runs if ids2names[task_id] in names]
+        dependencies = self._dependencies(declared)
+        for task_id in runs:
+            dependencies.setdefault(task_id, [])
+
+        critical = set()
+        task_id = max(runs, key=lambda i: (runs[i][2], runs[i][1], i in declared))
+        while task_id is not None:
+            critical.add(task_id)
+            task_id = max(dependencies[task_id], key=lambda i: runs[i][2], default=None)
+
+        timeline = []
+        for task_id, (status, start, end) in runs.items():
+            if dependencies[task_id]:
+                gap = max(0, start - max(runs[i][2] for i in dependencies[task_id]))
+            else:
+                gap = None
+
+            timeline.append(dict(
+                name=ids2names[task_id],
+                status=status,
+                start=round(start - t0),  # times are stored with a one-second resolution
+                end=round(end - t0),
+                requires=[ids2names[i] for i in dependencies[task_id]],
+                gap=gap,
+                critical=task_id in critical
+            ))
+
+        return sorted(timeline, key=lambda obj: (obj['start'], obj['end']))
+
+    def _get_durations(self):
+        """Returns the average duration of the successful runs of each task.
+
+        :return: dictionary of task ID -> number of seconds.
+        :rtype: dict
+        """
+        con = sqlite3.connect(self.db)
+        cur = con.cursor()
+        cur.execute('SELECT task_id, AVG((julianday(end_time) - julianday(start_time)) * 86400) '
+                    'FROM run '
+                    'WHERE status = ? '
+                    'AND start_time IS NOT NULL '
+                    'AND end_time IS NOT NULL '
+                    'GROUP BY task_id', (tsk.STATUS_SUCCESS,))
+        durations = {task_id: secs for task_id, secs in cur if task_id in self.tasks}
+        cur.close()
+        con.close()
+
+        return durations
+
+    @staticmethod
+    def _default_duration(durations):
+        """Duration assumed for tasks that never ran: the median of known durations (one minute if none)."""
+        if not durations:
+            return 60
+
+        values = sorted(durations.values())
+        return values[len(values) // 2]
+
+    def _dependencies(self, task_ids):
+        """Returns the dependencies of tasks, restricted to *task_ids*.
+
+        :return: dictionary of task ID -> list of task IDs.
+        :rtype: dict
+        """
+        names2ids = {task.name: task_id for task_id, task in self.tasks.items()}
+        dependencies = {}
+        for task_id in task_ids:
+            task = self.tasks[task_id]
+            dependencies[task_id] = [
+                names2ids[name] for name in task.requires + task.input
+                if names2ids.get(name) in task_ids
+            ]
+
+        return dependencies
+
+    def _rank(self, task_ids, durations):
+        """Computes the length of the longest path (in seconds) from each task to the end of the workflow.
+
+        :return: dictionary of task ID -> number of seconds.
+        :rtype: dict
+        """
+        default = self._default_duration(durations)
+        dependencies = self._dependencies(task_ids)
+        successors = {task_id: [] for task_id in task_ids}
+        for task_id, dependency_ids in dependencies.items():
+            for dependency_id in dependency_ids:
+                successors[dependency_id].append(task_id)
+
+        # Tasks in reverse topological order: successors are ranked before the tasks they depend on
+        n_successors = {task_id: len(successors[task_id]) for task_id in task_ids}
+        todo = [task_id for task_id in task_ids if not n_successors[task_id]]
+        ranks = {}
+        while todo:
+            i = todo.pop()
+            ranks[i] = durations.get(i, default) + max([ranks[j] for j in successors[i]] or [0])
+
+            for j in dependencies[i]:
+                n_successors[j] -= 1
+                if not n_successors[j]:
+                    todo.append(j)
+
+        return ranks
+
+    def _critical_path(self, task_ids, ranks):
+        """Returns the tasks on the longest path of the workflow, in execution order."""
+        dependencies = self._dependencies(task_ids)
+        successors = {task_id: [] for task_id in task_ids}
+        for task_id, dependency_ids in dependencies.items():
+            for dependency_id in dependency_ids:
+                successors[dependency_id].append(task_id)
+
+        path = []
+        candidates = [task_id for task_id in task_ids if not dependencies[task_id]]
+        while candidates:
+            task_id = max(candidates, key=lambda i: ranks[i])
+            path.append(task_id)
+            candidates = [i for i in successors[task_id] if i not in path]
+
+        return path
+
+    def _predict(self, task_ids, durations):
+        """Simulates the execution of tasks, honouring dependencies, resource pools, and the local pool concurrency.
+
+        :return: predicted number of seconds to run all tasks.
+        :rtype: float
+        """
+        default = self._default_duration(durations)
+        dependencies = self._dependencies(task_ids)
+        max_tasks = self.pool.max_tasks if self.pool is not None else None
+
+        now = 0
+        pending = set(task_ids)
+        done = set()
+        running = []  # (end time, task ID)
+        tokens = {}
+        while pending or running:
+            ready = [task_id for task_id in pending if all(i in done for i in dependencies[task_id])]
+            ready.sort(key=lambda task_id: (-self.tasks[task_id].priority, -self.tasks[task_id].rank))
+
+            for task_id in ready:
+                task = self.tasks[task_id]
+                if max_tasks and len(running) >= max_tasks:
+                    break
+                elif self._full_pools(task, tokens):
+                    continue
+
+                for pool_name, n in task.pools.items():
+                    tokens[pool_name] = tokens.get(pool_name, 0) + n
+
+                pending.remove(task_id)
+                running.append((now + durations.get(task_id, default), task_id))
+
+            if not running:
+                break  # should not happen, unless dependencies are circular
+
+            now = min(end for end, task_id in running)
+            for end, task_id in [item for item in running if item[0] == now]:
+                running.remove((end, task_id))
+                done.add(task_id)
+                for pool_name, n in self.tasks[task_id].pools.items():
+                    tokens[pool_name] -= n
+
+        return now
+
+    def _full_pools(self, task, tokens):
+        """Returns the names of the resource pools that do not have enough tokens left for a task.
+
+        A task requiring more tokens than the capacity of a pool can run when the pool is unused.
+        """
+        full = []
+        for pool_name, n in sorted(task.pools.items()):
+            capacity = self.pools.get(pool_name)
+            used = tokens.get(pool_name, 0)
+
+            if capacity is not None and used and used + n > capacity:
+                full.append(pool_name)
+
+        return full
+
     def _update_runs(self, runs_started, runs_terminated):
         """
         
@@ -242,26 +709,200 @@ class Workflow(object):
         con = sqlite3.connect(self.db)
         cur = con.cursor()
 
-        for task_id, infile, outfile in runs_started:
+        for task_id, infile, outfile, cache_key in runs_started:
             cur.execute(
                 "UPDATE run "
-                "SET status = ?, infile = ?, outfile = ?, start_time = strftime('%Y-%m-%d %H:%M:%S') "
+                "SET status = ?, infile = ?, outfile = ?, cache_key = ?, start_time = strftime('%Y-%m-%d %H:%M:%S') "
                 "WHERE task_id = ? AND active = 1",
-                (tsk.STATUS_RUNNING, infile, outfile, task_id)
+                (tsk.STATUS_RUNNING, infile, outfile, cache_key, task_id)
             )
 
-        for task_id, status, result in runs_terminated:
-            cur.execute(
-                "UPDATE run "
-                "SET status = ?, result = ?, end_time = strftime('%Y-%m-%d %H:%M:%S') "
-                "WHERE task_id = ? AND active = 1",
-                (status, json.dumps(result), task_id)
-            )
+        for task_id, status, result, stats in runs_terminated:
+            if stats is None:
+                # Map task whose partitions were processed: resources used by its function already recorded
+                cur.execute(
+                    "UPDATE run "
+                    "SET status = ?, result = ?, end_time = strftime('%Y-%m-%d %H:%M:%S') "
+                    "WHERE task_id = ? AND active = 1",
+                    (status, json.dumps(result), task_id)
+                )
+                stats = {}
+            else:
+                cur.execute(
+                    "UPDATE run "
+                    "SET status = ?, result = ?, end_time = strftime('%Y-%m-%d %H:%M:%S'), {} "
+                    "WHERE task_id = ? AND active = 1".format(', '.join(col + ' = ?' for col, _ in STATS_COLUMNS)),
+                    [status, json.dumps(result)] + [stats.get(col) for col in self._stats_keys()] + [task_id]
+                )
+
+            self._insert_statements(cur, task_id, stats.get('statements'))
+
+            if status == tsk.STATUS_SUCCESS:
+                self._save_cache(cur, task_id, result)
 
         cur.close()
         con.commit()
         con.close()
 
+    def _map(self, parent_id, partitions, resume=False):
+        """Creates the tasks processing the partitions returned by a map task, and their runs.
+
+        Tasks are named after the map task, and the index of their partition (e.g. *name:0*).
+
+        :param parent_id: ID of the map task.
+        :param partitions: list of partitions.
+        :param resume: if ``True``, partitions successfully processed by the active run of their task are skipped.
+        """
+        parent = self.tasks[parent_id]
+        child_ids = []
+        skipped = 0
+
+        con = sqlite3.connect(self.db)
+        cur = con.cursor()
+
+        for i, value in enumerate(partitions):
+            name = '{}:{}'.format(parent.name, i)
+            cur.execute('SELECT id FROM task WHERE name = ?', (name,))
+            row = cur.fetchone()
+            if row is None:
+                cur.execute('INSERT INTO task (name) VALUES (?)', (name,))
+                child_id = cur.lastrowid
+            else:
+                child_id = row[0]
+
+            child = parent.map.partition(value, i, name)
+            child.rank = parent.rank
+            self.tasks[child_id] = child
+            child_ids.append(child_id)
+
+            if resume:
+                cur.execute('SELECT status FROM run WHERE task_id = ? AND active = 1', (child_id,))
+                row = cur.fetchone()
+                if row is not None and row[0] == tsk.STATUS_SUCCESS:
+                    skipped += 1
+                    continue
+
+            cur.execute('UPDATE run SET active = 0 WHERE task_id = ?', (child_id,))
+            cur.execute("INSERT INTO run (task_id, create_time) VALUES (?, strftime('%Y-%m-%d %H:%M:%S'))",
+                        (child_id,))
+
+        con.commit()
+        cur.close()
+        con.close()
+
+        if skipped:
+            logging.info("task '{}' resumed: {} of {} partition(s) already processed".format(
+                parent.name, skipped, len(partitions)
+            ))
+        elif resume:
+            logging.info("task '{}' resumed".format(parent.name))
+
+        self.children[parent_id] = child_ids
+
+    def _save_cache(self, cur, task_id, result):
+        """Records the result of a successful run, and the state of its outputs, under the run's cache key."""
+        cur.execute('SELECT cache_key FROM run WHERE task_id = ? AND active = 1', (task_id,))
+        row = cur.fetchone()
+        task = self.tasks.get(task_id)
+        if row is None or row[0] is None or task is None or task.cache is None:
+            return
+
+        outputs = []
+        for filepath in task.cache.get('outputs', []):
+            try:
+                st = os.stat(filepath)
+            except FileNotFoundError:
+                logging.warning("task '{}': output {} not found (result not cached)".format(task.name, filepath))
+                return
+            else:
+                outputs.append([filepath, st.st_size, st.st_mtime_ns])
+
+        cur.execute(
+            "INSERT OR REPLACE INTO cache (key, task_id, result, outputs, create_time) "
+            "VALUES (?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%S'))",
+            (row[0], task_id, json.dumps(result), json.dumps(outputs))
+        )
+
+    def _get_cached(self, key):
+        """Looks up the result of a previous run, reusable if its outputs did not change since.
+
+        :param key: fingerprint of the task (see :py:meth:`Task.fingerprint`).
+        :return: whether a reusable result was found, and the result.
+        :rtype: tuple
+        """
+        con = sqlite3.connect(self.db)
+        cur = con.cursor()
+        cur.execute('SELECT result, outputs FROM cache WHERE key = ?', (key,))
+        row = cur.fetchone()
+        cur.close()
+        con.close()
+
+        if row is None:
+            return False, None
+
+        result, outputs = row
+        for filepath, size, mtime in json.loads(outputs):
+            try:
+                st = os.stat(filepath)
+            except FileNotFoundError:
+                return False, None
+
+            if st.st_size != size or st.st_mtime_ns != mtime:
+                return False, None  # output deleted or modified since
+
+        return True, json.loads(result)
+
+    def _hash_file(self, filepath):
+        """Returns the digest of a file, computed once per size/modification time of the file."""
+        st = os.stat(filepath)
+
+        con = sqlite3.connect(self.db)
+        cur = con.cursor()
+        cur.execute('SELECT digest FROM file_hash WHERE path = ? AND size = ? AND mtime = ?',
+                    (filepath, st.st_size, st.st_mtime_ns))
+        row = cur.fetchone()
+
+        if row is None:
+            logging.info('computing the checksum of {}'.format(filepath))
+            digest = tsk.hash_file(filepath)
+            cur.execute('INSERT OR REPLACE INTO file_hash (path, size, mtime, digest) VALUES (?, ?, ?, ?)',
+                        (filepath, st.st_size, st.st_mtime_ns, digest))
+            con.commit()
+        else:
+            digest = row[0]
+
+        cur.close()
+        con.close()
+
+        return digest
+
+    @staticmethod
+    def _insert_statements(cur, task_id, statements):
+        if not statements:
+            return
+
+        cur.execute('SELECT rowid FROM run WHERE task_id = ? AND active = 1', (task_id,))
+        row = cur.fetchone()
+        if row is None:
+            return
+
+        cur.executemany(
+            'INSERT INTO statement (run_id, tag, executions, elapsed, max_elapsed, {}) '
+            'VALUES (?, ?, ?, ?, ?, {})'.format(
+                ', '.join(col for col, _ in STATEMENT_COLUMNS), ', '.join('?' for _ in STATEMENT_COLUMNS)
+            ),
+            [
+                [row[0], obj['tag'], obj['executions'], obj['elapsed'], obj['max_elapsed']] +
+                [obj.get(col) for col, _ in STATEMENT_COLUMNS]
+                for obj in statements
+            ]
+        )
+
+    @staticmethod
+    def _stats_keys():
+        # Keys of the dictionary written by _runner.py, in the order of STATS_COLUMNS
+        return ['status' if col == 'exit_status' else col for col, _ in STATS_COLUMNS]
+
     def _get_runs(self):
         """
 
@@ -313,25 +954,34 @@ class Workflow(object):
         con = sqlite3.connect(self.db)
         cur = con.cursor()
 
-        # Get the id/name of all existing tasks
+        # Get the id/name of all existing tasks (tasks processing partitions of map tasks cannot be run on their own)
+        children = {child_id for child_ids in self.children.values() for child_id in child_ids}
         task_names = []
         task_ids = []
         cur.execute('SELECT id, name FROM task')
         for task_id, name in cur:
-            task_ids.append(task_id)
-            task_names.append(name)
+            if task_id in self.tasks and task_id not in children:
+                task_ids.append(task_id)
+                task_names.append(name)
 
         # Get the 'active' runs
         tasks_done = []
         tasks_running = []
+        tasks_mapped = []
         runs_terminated = []
         cur.execute(
-            'SELECT task_id, status, infile, outfile '
+            'SELECT task_id, status, infile, outfile, result '
             'FROM run '
             'WHERE active = 1'
         )
-        for task_id, status, infile, outfile in cur:
-            if status == tsk.STATUS_SUCCESS:
+        for task_id, status, infile, outfile, result in cur.fetchall():
+            task = self.tasks.get(task_id)
+            is_map = task is not None and task.map is not None
+
+            if is_map and status in (tsk.STATUS_MAPPED, tsk.STATUS_ERROR) and result and result.startswith('['):
+                # Partitions were being processed, or some of them failed
+                tasks_mapped.append(task_id)
+            elif status == tsk.STATUS_SUCCESS:
                 # Task completed successfully: tasks depending on this one car run
                 tasks_done.append(task_id)
             elif status == tsk.STATUS_RUNNING:
@@ -346,8 +996,19 @@ class Workflow(object):
                         if os.path.isfile(infile):
                             os.unlink(infile)
 
-                        runs_terminated.append((task_id, result))
-                        tasks_done.append(task_id)
+                        stats = tsk.Task.read_stats(outfile + '.status') or {}
+                        if os.path.isfile(outfile + '.status'):
+                            os.unlink(outfile + '.status')
+
+                        if stats.get('status', 0) == 0 and is_map and isinstance(result, (list, tuple)):
+                            # Partitions processed when the workflow runs
+                            runs_terminated.append((task_id, tsk.STATUS_MAPPED, list(result), stats))
+                            tasks_mapped.append(task_id)
+                        elif stats.get('status', 0) == 0:
+                            runs_terminated.append((task_id, tsk.STATUS_SUCCESS, result, stats))
+                            tasks_done.append(task_id)
+                        else:
+                            runs_terminated.append((task_id, tsk.STATUS_ERROR, None, stats))
                     else:
                         # Nope, let's assume the task is still running
                         tasks_running.append(task_id)
@@ -356,13 +1017,17 @@ class Workflow(object):
 
         # Update completed tasks that where still flagged as running in the DB
         if runs_terminated:
-            for task_id, result in runs_terminated:
+            for task_id, status, result, stats in runs_terminated:
                 cur.execute(
                     "UPDATE run "
-                    "SET status = ?, result = ?, end_time = strftime('%Y-%m-%d %H:%M:%S') "
-                    "WHERE task_id = ? AND active = 1",
-                    (tsk.STATUS_SUCCESS, json.dumps(result), task_id)
+                    "SET status = ?, result = ?, end_time = strftime('%Y-%m-%d %H:%M:%S'), {} "
+                    "WHERE task_id = ? AND active = 1".format(', '.join(col + ' = ?' for col, _ in STATS_COLUMNS)),
+                    [status, json.dumps(result)] + [stats.get(col) for col in self._stats_keys()] + [task_id]
                 )
+                self._insert_statements(cur, task_id, stats.get('statements'))
+
+                if status == tsk.STATUS_SUCCESS:
+                    self._save_cache(cur, task_id, result)
 
             con.commit()  # commit even if param `commit` is False as we are not creating new runs here
 
@@ -426,15 +1091,31 @@ class Workflow(object):
                 )
                 exit(1)
 
+            if rerun:
+                resumed = []
+            else:
+                # Map tasks interrupted, or with failed partitions: only process partitions not processed yet
+                resumed = [task_id for task_id in to_run_ids if task_id in tasks_mapped]
+                if resumed:
+                    cur.execute(
+                        'UPDATE run '
+                        'SET status = ?, end_time = NULL '
+                        'WHERE active = 1 AND task_id IN ({})'.format(','.join(['?' for _ in resumed])),
+                        [tsk.STATUS_MAPPED] + resumed
+                    )
+
+            new_run_ids = [task_id for task_id in to_run_ids if task_id not in resumed]
             cur.execute(
                 'UPDATE run '
                 'SET active = 0 '
-                'WHERE task_id IN ({})'.format(','.join(['?' for _ in to_run_ids])),
-                to_run_ids
+                'WHERE task_id IN ({})'.format(','.join(['?' for _ in new_run_ids])),
+                new_run_ids
             )
         else:
             # Run all tasks, except those with the "skip" flag on
-            to_run_ids = [task_id for task_id, task in self.tasks.items() if not task.skip]
+            to_run_ids = new_run_ids = [
+                task_id for task_id, task in self.tasks.items() if not task.skip and task_id not in children
+            ]
 
             # Set as inactive all active runs (since all tasks are going to run)
             cur.execute('UPDATE run SET active = 0')
@@ -443,7 +1124,7 @@ class Workflow(object):
         cur.executemany(
             "INSERT INTO run (task_id, create_time) "
             "VALUES (?, strftime('%Y-%m-%d %H:%M:%S'))",
-            [(task_id,) for task_id in to_run_ids]
+            [(task_id,) for task_id in new_run_ids]
         )
 
         cur.close()
@@ -454,13 +1135,27 @@ class Workflow(object):
 
     def stop(self):
         if self.cascade_kill:
+            tsk.poll_lsf(list(self.tasks.values()))
+
+            to_stop = []
             to_update = []
             for task_id, task in self.tasks.items():
                 if task.is_running():
-                    task.stop()
-                    to_update.append((task_id, task.status, None))
+                    to_stop.append(task)
+                    to_update.append((task_id, tsk.STATUS_ERROR, None, {}))
 
+            # One call to bkill for all LSF tasks
+            tsk.stop_tasks(to_stop)
             self._update_runs([], to_update)
 
     def __del__(self):
         self.stop()
+
+
+def _format_secs(secs):
+    if secs is None:
+        return '-'
+
+    m, s = divmod(int(round(secs)), 60)
+    h, m = divmod(m, 60)
+    return '{}:{:02d}:{:02d}'.format(h, m, s)